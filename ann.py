@@ -0,0 +1,239 @@
+"""Approximate nearest neighbors for the content model.
+
+TF-IDF rows are reduced to dense float32 embeddings (LSA) and indexed with
+an inverted file (IVF): books are clustered with k-means, and a query is
+only compared, with the exact TF-IDF cosine, with the books in its
+`n_probe` closest clusters. `n_probe` is the recall/latency knob. Compare
+against exact search with:
+
+    $ python ann.py report --n-probe 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from catalog import CATALOG_PATH, read_catalog
+from neighbors import BLOCK_BUDGET, NEIGHBORS, NeighborIndex, top_n
+
+DIMS = 128
+# tuned with `report` on benchmarks.synthetic catalogs (~sqrt(N) lists):
+# recall@25 0.98 / 0.82 / 0.72 at 5k / 20k / 50k books, and the 50k build
+# takes 180 s against 390 s exact. Their similarities are nearly flat, so
+# real catalogs with topical structure should recall more.
+N_PROBE = 32
+# the embedding is fitted on the most frequent terms only: the (1, 2)-gram
+# vocabulary has millions of columns, and a rare term adds little to LSA
+MAX_FEATURES = 2**16
+# rows the SVD is fitted on; the rest are only projected
+SVD_SAMPLE = 50_000
+
+
+def embed(matrix, dims=DIMS, max_features=MAX_FEATURES, sample=SVD_SAMPLE):
+    """Reduce a TF-IDF matrix to l2-normalized float32 embeddings"""
+    matrix = matrix.tocsr()
+    n_rows, n_cols = matrix.shape
+    if n_cols > max_features:
+        df = np.bincount(matrix.indices, minlength=n_cols)
+        columns = np.sort(np.argsort(-df, kind="stable")[:max_features])
+        matrix = matrix[:, columns]
+    dims = min(dims, matrix.shape[1] - 1, n_rows - 1)
+    svd = TruncatedSVD(dims, algorithm="randomized", random_state=0)
+    if n_rows > sample:
+        rng = np.random.default_rng(0)
+        svd.fit(matrix[np.sort(rng.choice(n_rows, sample, replace=False))])
+    else:
+        svd.fit(matrix)
+
+    embeddings = np.empty((n_rows, dims), dtype=np.float32)
+    block_size = max(1, BLOCK_BUDGET // dims)
+    for start in range(0, n_rows, block_size):
+        block = svd.transform(matrix[start : start + block_size])
+        embeddings[start : start + block_size] = normalize(block)
+    return embeddings
+
+
+class IVFIndex:
+    """Inverted-file index over l2-normalized embeddings.
+
+    The rows of list `c` are `rows[offsets[c]:offsets[c + 1]]`. `matrix`
+    is the TF-IDF matrix candidates are scored with; without it they are
+    scored by their embeddings.
+    """
+
+    def __init__(self, embeddings, centroids, offsets, rows, matrix=None):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.matrix = matrix
+        self.labels = np.empty(len(rows), dtype=np.int32)
+        self.labels[rows] = np.repeat(np.arange(len(centroids), dtype=np.int32), np.diff(offsets))
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def search(self, row, k=NEIGHBORS, n_probe=N_PROBE):
+        """Return (ids, scores) of the approximate top-k neighbors of `row`"""
+        ids, scores = self.search_batch([row], k, n_probe)
+        return ids[0], scores[0]
+
+    def probe(self, rows, n_probe=N_PROBE):
+        """The n_probe lists whose centroids are closest to each of `rows`"""
+        n_probe = min(n_probe, self.n_lists)
+        probes = np.empty((len(rows), n_probe), dtype=np.int32)
+        step = max(1, BLOCK_BUDGET // self.n_lists)
+        for start in range(0, len(rows), step):
+            sims = self.embeddings[rows[start : start + step]] @ self.centroids.T
+            probes[start : start + step] = np.argpartition(-sims, n_probe - 1, axis=1)[:, :n_probe]
+        return probes
+
+    def similarities(self, rows, members):
+        """Dense (len(rows), len(members)) cosine similarities; exact TF-IDF
+        ones when the index has the matrix"""
+        if self.matrix is None:
+            return self.embeddings[rows] @ self.embeddings[members].T
+        return (self.matrix[rows] @ self.matrix[members].T).toarray()
+
+    def search_batch(self, rows, k=NEIGHBORS, n_probe=N_PROBE):
+        """Return the (len(rows), k) ids and scores of the approximate top-k
+        neighbors of several indexed rows.
+
+        A query is only compared with the rows of its n_probe closest lists.
+        Ties go to the lower row, as in the exact table.
+        """
+        rows = np.asarray(rows)
+        probes = self.probe(rows, n_probe)
+        ids = np.full((len(rows), k), -1, dtype=np.int32)
+        scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+
+        # each list is scored in one product against all the queries probing
+        # it (sparse products have a per-call cost that grows with the
+        # vocabulary), and merged into their running top-k
+        lists = probes.ravel()
+        order = np.argsort(lists, kind="stable")
+        for pairs in np.split(order, np.flatnonzero(np.diff(lists[order])) + 1):
+            c = lists[pairs[0]]
+            members = self.rows[self.offsets[c] : self.offsets[c + 1]]
+            queries = pairs // probes.shape[1]
+            step = max(1, BLOCK_BUDGET // max(len(members), 1))
+            for start in range(0, len(queries) if len(members) else 0, step):
+                block = queries[start : start + step]
+                sims = self.similarities(rows[block], members)
+                # a book is not its own neighbor
+                own = np.flatnonzero(self.labels[rows[block]] == c)
+                sims[own, np.searchsorted(members, rows[block[own]])] = -np.inf
+                best, top = top_n(sims, k)
+                found = np.isfinite(top)
+                ids[block], scores[block] = _merge(
+                    ids[block], scores[block], np.where(found, members[best], -1),
+                    np.where(found, top, -np.inf), k,
+                )
+        scores[ids < 0] = np.nan
+        return ids, scores
+
+
+def _merge(ids, scores, new_ids, new_scores, k):
+    """Keep the k best of two -1 padded candidate lists per row"""
+    all_ids = np.concatenate([ids, new_ids], axis=1)
+    # ascending rows (padding last), so ties go to the lower row
+    order = np.argsort(np.where(all_ids >= 0, all_ids, np.iinfo(np.int32).max), axis=1,
+                       kind="stable")
+    all_ids = np.take_along_axis(all_ids, order, axis=1)
+    all_scores = np.take_along_axis(np.concatenate([scores, new_scores], axis=1), order, axis=1)
+    best, top = top_n(np.where(all_ids >= 0, all_scores, -np.inf), k)
+    found = np.isfinite(top)
+    return (
+        np.where(found, np.take_along_axis(all_ids, np.maximum(best, 0), axis=1), -1),
+        np.where(found, top, -np.inf),
+    )
+
+
+def build_ivf(embeddings, n_lists=None, matrix=None):
+    """Cluster `embeddings` into ~sqrt(N) inverted lists"""
+    n_rows = len(embeddings)
+    if n_lists is None:
+        n_lists = max(1, int(np.sqrt(n_rows)))
+    n_lists = min(n_lists, n_rows)
+    kmeans = MiniBatchKMeans(n_lists, random_state=0, n_init=3).fit(embeddings)
+    centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+    labels = kmeans.labels_
+    rows = np.argsort(labels, kind="stable").astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+    return IVFIndex(embeddings, centroids, offsets, rows, matrix)
+
+
+def build_ann_neighbor_index(matrix, k=NEIGHBORS, n_probe=N_PROBE, dims=DIMS, n_lists=None):
+    """Approximate counterpart of neighbors.build_neighbor_index.
+
+    Costs O(N * candidates) instead of O(N^2).
+    """
+    matrix = matrix.tocsr()
+    index = build_ivf(embed(matrix, dims), n_lists, matrix)
+    ids, scores = index.search_batch(np.arange(matrix.shape[0]), k, n_probe)
+    return NeighborIndex(ids, scores)
+
+
+def recall_at_k(approx_ids, exact_ids):
+    """Mean fraction of the exact neighbors that the approximate lists found"""
+    hits = 0
+    total = 0
+    for approx, exact in zip(approx_ids, exact_ids):
+        exact = exact[exact >= 0]
+        hits += len(np.intersect1d(approx[approx >= 0], exact))
+        total += len(exact)
+    return hits / total if total else 1.0
+
+
+def report(matrix, k=NEIGHBORS, probes=(8, 16, 32), sample=500, dims=DIMS, n_lists=None):
+    """Print recall@k and per-query latency of each n_probe against exact search"""
+    matrix = matrix.tocsr()
+    rng = np.random.default_rng(0)
+    rows = rng.choice(matrix.shape[0], min(sample, matrix.shape[0]), replace=False)
+
+    start = time.perf_counter()
+    sims = (matrix[rows] @ matrix.T).toarray()
+    exact_ids, _ = top_n(sims, k, exclude=rows)
+    exact_time = (time.perf_counter() - start) / len(rows)
+
+    index = build_ivf(embed(matrix, dims), n_lists, matrix)
+    print("{} books, {} lists, k={}".format(matrix.shape[0], index.n_lists, k))
+    print("{:>8} {:>10} {:>12}".format("n_probe", "recall@k", "ms / query"))
+    print("{:>8} {:>10.3f} {:>12.3f}".format("exact", 1.0, exact_time * 1e3))
+    results = []
+    for n_probe in probes:
+        start = time.perf_counter()
+        approx_ids, _ = index.search_batch(rows, k, n_probe)
+        elapsed = (time.perf_counter() - start) / len(rows)
+        recall = recall_at_k(approx_ids, exact_ids)
+        results.append({"n_probe": n_probe, "recall": recall, "ms_per_query": elapsed * 1e3})
+        print("{:>8} {:>10.3f} {:>12.3f}".format(n_probe, recall, elapsed * 1e3))
+    return results
+
+
+def main():
+    # content_model builds on this module, so import it only for the CLI
+    from content_model import book_content, make_vectorizer
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    report_cmd = sub.add_parser("report", help="recall@k of the ANN index against exact search")
+    report_cmd.add_argument("--catalog", default=CATALOG_PATH)
+    report_cmd.add_argument("-k", type=int, default=NEIGHBORS)
+    report_cmd.add_argument("--n-probe", type=int, nargs="+", default=[8, 16, N_PROBE])
+    report_cmd.add_argument("--sample", type=int, default=500)
+    report_cmd.add_argument("--dims", type=int, default=DIMS)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        matrix = make_vectorizer().fit_transform(book_content(read_catalog(args.catalog)))
+        report(matrix, args.k, args.n_probe, args.sample, args.dims)
+
+
+if __name__ == "__main__":
+    main()
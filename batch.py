@@ -0,0 +1,234 @@
+"""Bulk recommendations for many books or users at once.
+
+Scores whole chunks of queries with array operations against the saved
+models, spreads the chunks over a process pool and streams the results to
+JSON Lines or Parquet:
+
+    $ python batch.py books --model content-plus -n 10 --out similar.jsonl
+    $ python batch.py users -n 10 --out for_you.parquet --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog import UI_COLUMNS, read_catalog
+from collab import load_collab
+from content_model import load_content
+from neighbors import NEIGHBORS, top_n
+
+MODELS = ("content", "content-plus", "collab")
+BOOK_CHUNK = 4096
+USER_CHUNK = 128
+
+
+def content_batch(neighbors, rows, n):
+    """content_recommendation for every catalog row in `rows`.
+
+    Returns a (len(rows), n) array of catalog rows, padded with -1.
+    """
+    ids, _ = neighbors.batch(rows, n)
+    out = np.full((len(rows), n), -1, dtype=np.int32)
+    out[:, : ids.shape[1]] = ids
+    return out
+
+
+def content_plus_batch(neighbors, rows, n, ratings_count, average_rating):
+    """improved_recommendation for every catalog row in `rows`.
+
+    Each row's 25 nearest books are re-ranked by a weighted rating, keeping
+    only those with at least the 75th percentile of the candidates'
+    ratings_count, as improved_recommendation does one title at a time.
+    """
+    ids, _ = neighbors.batch(rows, NEIGHBORS)
+    valid = ids >= 0
+    v = np.where(valid, ratings_count[ids], np.nan)
+    R = np.where(valid, average_rating[ids], np.nan)
+    m = np.nanquantile(v, 0.75, axis=1, keepdims=True)
+    C = np.nanmedian(R, axis=1, keepdims=True)
+    weighted = (v / (v + m) * R) + (m / (m + v) * C)
+    weighted = np.where(valid & (v >= m), weighted, -np.inf)
+
+    order = np.argsort(-weighted, axis=1, kind="stable")[:, :n]
+    out = np.take_along_axis(ids, order, axis=1)
+    out[~np.isfinite(np.take_along_axis(weighted, order, axis=1))] = -1
+    padded = np.full((len(rows), n), -1, dtype=np.int32)
+    padded[:, : out.shape[1]] = out
+    return padded
+
+
+def collab_batch(model, user_rows, n):
+    """get_recommendation_svd for every factor row in `user_rows`"""
+    scores = model.user_factors[user_rows] @ model.item_factors.T + model.item_bias
+    read = model.ratings.csr[user_rows].tocoo()
+    scores[read.row, read.col] = -np.inf
+    ids, best = top_n(scores, n)
+    ids[~np.isfinite(best)] = -1
+    return ids
+
+
+# per-process state: catalog columns and mmapped models, loaded once per worker
+_state = {}
+
+
+def _load(model):
+    books = read_catalog(columns=UI_COLUMNS)
+    version = books.attrs["catalog_version"]
+    _state["book_ids"] = books["book_id"].to_numpy()
+    _state["ratings_count"] = books["ratings_count"].to_numpy(dtype=np.float64)
+    _state["average_rating"] = books["average_rating"].to_numpy(dtype=np.float64)
+    if model == "collab":
+        _state["model"] = load_collab(version=version)
+    else:
+        _state["model"] = load_content(version=version)
+    if _state["model"] is None:
+        raise RuntimeError("no {} model for catalog version {}".format(model, version))
+
+
+def _score(model, queries, n):
+    """Score one chunk; returns (book_id or user_id, [recommended book_id, ...]) pairs"""
+    if model == "collab":
+        # unknown users get an empty list rather than failing the chunk
+        rows = [_state["model"].user_row(q) for q in queries]
+        known = np.array([r is not None for r in rows], dtype=bool)
+        recs = np.full((len(queries), n), -1, dtype=np.int32)
+        if known.any():
+            user_rows = np.array([r for r in rows if r is not None])
+            recs[known] = collab_batch(_state["model"], user_rows, n)
+    elif model == "content-plus":
+        recs = content_plus_batch(
+            _state["model"].neighbors, queries, n,
+            _state["ratings_count"], _state["average_rating"],
+        )
+    else:
+        recs = content_batch(_state["model"].neighbors, queries, n)
+    book_ids = _state["book_ids"]
+    keys = queries if model == "collab" else book_ids[queries]
+    return [
+        (int(key), [int(book_ids[r]) for r in rec if r >= 0])
+        for key, rec in zip(keys, recs)
+    ]
+
+
+class JSONLWriter:
+    def __init__(self, path, key):
+        self.file = sys.stdout if path == "-" else open(path, "w")
+        self.key = key
+
+    def write(self, results):
+        for query, recs in results:
+            self.file.write(json.dumps({self.key: query, "recommendations": recs}) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, key):
+        # pyarrow ships with streamlit; only needed for this output format
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.key = key
+        self.schema = pa.schema([(key, pa.int64()), ("recommendations", pa.list_(pa.int64()))])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, results):
+        table = self.pa.table(
+            {self.key: [q for q, _ in results], "recommendations": [r for _, r in results]},
+            schema=self.schema,
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path, key):
+    if path.endswith(".parquet"):
+        return ParquetWriter(path, key)
+    return JSONLWriter(path, key)
+
+
+def run(model, queries, n, writer, workers=1, chunk=None, progress=sys.stderr):
+    """Score `queries` (catalog rows, or user ids for "collab") chunk by chunk.
+
+    Results are written in query order as chunks complete; a progress and
+    throughput line goes to `progress` after every chunk.
+    """
+    if chunk is None:
+        chunk = USER_CHUNK if model == "collab" else BOOK_CHUNK
+    chunks = [queries[i : i + chunk] for i in range(0, len(queries), chunk)]
+    start = time.perf_counter()
+    done = 0
+
+    def report(results):
+        nonlocal done
+        writer.write(results)
+        done += len(results)
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            progress.write("\r{}/{} queries, {:.0f}/s".format(done, len(queries), done / elapsed))
+            progress.flush()
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_load, initargs=(model,)) as pool:
+            for results in pool.map(_score, [model] * len(chunks), chunks, [n] * len(chunks)):
+                report(results)
+    else:
+        _load(model)
+        for queries_chunk in chunks:
+            report(_score(model, queries_chunk, n))
+    if progress is not None:
+        progress.write("\n")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    books_cmd = sub.add_parser("books", help="similar books for catalog books")
+    books_cmd.add_argument("--model", choices=MODELS[:2], default="content")
+    books_cmd.add_argument("--book-ids", help="file with one book_id per line (default: all)")
+    users_cmd = sub.add_parser("users", help="collaborative recommendations for users")
+    users_cmd.add_argument("--user-ids", help="file with one user_id per line (default: all)")
+    for cmd in (books_cmd, users_cmd):
+        cmd.add_argument("-n", type=int, default=10)
+        cmd.add_argument("--out", default="-", help="*.jsonl, *.parquet or - for stdout")
+        cmd.add_argument("--workers", type=int, default=os.cpu_count())
+        cmd.add_argument("--chunk", type=int)
+    args = parser.parse_args()
+
+    if args.command == "books":
+        model, key = args.model, "book_id"
+        books = read_catalog(columns=["book_id"])
+        if args.book_ids:
+            wanted = np.loadtxt(args.book_ids, dtype=np.int64, ndmin=1)
+            queries = books.index[books["book_id"].isin(wanted)].to_numpy()
+        else:
+            queries = np.arange(len(books))
+    else:
+        model, key = "collab", "user_id"
+        if args.user_ids:
+            queries = np.loadtxt(args.user_ids, dtype=np.int64, ndmin=1)
+        else:
+            collab = load_collab()
+            if collab is None:
+                parser.error("no collaborative model, run `python collab.py train` first")
+            queries = np.asarray(collab.ratings.user_ids)
+
+    writer = open_writer(args.out, key)
+    try:
+        run(model, queries, args.n, writer, args.workers, args.chunk)
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
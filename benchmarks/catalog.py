@@ -0,0 +1,83 @@
+"""Load time and memory of the CSV catalog against the columnar copy.
+
+Every loader runs in a fresh interpreter so its resident memory is not
+mixed up with an earlier run:
+
+    $ python -m benchmarks.catalog --catalog data/books_cleaned.csv
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from catalog import CATALOG_PATH, UI_COLUMNS, convert_catalog
+
+LOADERS = {
+    "csv": "pd.read_csv({csv!r})",
+    "csv (UI columns)": "pd.read_csv({csv!r}, usecols={columns!r})",
+    "columnar": "read_columnar({columnar!r})",
+    "columnar (UI columns)": "read_columnar({columnar!r}, columns={columns!r})",
+}
+
+# resident set size from /proc (Linux), in MB
+SCRIPT = """
+import json, os, time
+import pandas as pd
+from catalog import read_columnar
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+base = rss()
+start = time.perf_counter()
+books = {load}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss() - base,
+                  "frame_mb": books.memory_usage(deep=True).sum() / 2**20}}))
+"""
+
+
+def measure(load):
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(load=load)],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def run(csv, repeat):
+    csv = os.path.abspath(csv)
+    with tempfile.TemporaryDirectory() as tmp:
+        columnar = os.path.join(tmp, "catalog")
+        convert_catalog(csv, columnar)
+        print("{:<24} {:>10} {:>14} {:>12}".format("loader", "time (s)", "RSS (MB)", "frame (MB)"))
+        results = {}
+        for name, template in LOADERS.items():
+            load = template.format(csv=csv, columnar=columnar, columns=UI_COLUMNS)
+            runs = [measure(load) for _ in range(repeat)]
+            best = min(runs, key=lambda r: r["seconds"])
+            results[name] = best
+            print("{:<24} {:>10.3f} {:>14.1f} {:>12.1f}".format(
+                name, best["seconds"], best["rss_mb"], best["frame_mb"]
+            ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = run(args.catalog, args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
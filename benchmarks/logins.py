@@ -0,0 +1,102 @@
+"""Concurrent login and signup throughput of the old user table against `UserStore`.
+
+The old code shared one connection between all sessions (so logins took
+turns), ran CREATE TABLE before every login and scanned the unindexed
+table; signups committed one at a time.
+
+    $ python -m benchmarks.logins --users 100000 --threads 1 8
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from user_store import UserStore
+
+
+class SharedConnection:
+    """The module-level connection main.py used to open"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def login(self, username, password_hash):
+        with self.lock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS userstable(username TEXT,password TEXT)")
+            return self.conn.execute(
+                "SELECT * FROM userstable WHERE username =? AND password = ?",
+                (username, password_hash),
+            ).fetchall()
+
+    def add_user(self, username, password_hash):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO userstable(username,password) VALUES (?,?)", (username, password_hash)
+            )
+            self.conn.commit()
+
+
+def fill(path, users):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE userstable(username TEXT,password TEXT)")
+        conn.executemany(
+            "INSERT INTO userstable VALUES (?,?)",
+            (("user{}".format(i), "hash{}".format(i)) for i in range(users)),
+        )
+    conn.close()
+
+
+def throughput(fn, args, threads):
+    """Calls per second of `fn` over `args` from `threads` threads"""
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda a: fn(*a), args))
+    return len(args) / (time.perf_counter() - start)
+
+
+def run(users, logins, signups, threads):
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, users, logins)
+    login_args = [("user{}".format(i), "hash{}".format(i)) for i in picks]
+    print("{:>8} {:>8} {:>18} {:>18} {:>18} {:>18}".format(
+        "users", "threads", "old logins/s", "new logins/s", "old signups/s", "new signups/s"
+    ))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_threads in threads:
+            old_path = os.path.join(tmp, "old{}.db".format(n_threads))
+            new_path = os.path.join(tmp, "new{}.db".format(n_threads))
+            fill(old_path, users)
+            fill(new_path, users)
+            old, new = SharedConnection(old_path), UserStore(new_path)
+
+            signup_args = [("new{}-{}".format(n_threads, i), "hash") for i in range(signups)]
+            row = (
+                throughput(old.login, login_args, n_threads),
+                throughput(new.login, login_args, n_threads),
+                throughput(old.add_user, signup_args, n_threads),
+                throughput(new.add_user, signup_args, n_threads),
+            )
+            print("{:>8} {:>8} {:>18,.0f} {:>18,.0f} {:>18,.0f} {:>18,.0f}".format(
+                users, n_threads, *row
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--logins", type=int, default=2_000)
+    parser.add_argument("--signups", type=int, default=500)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+    run(args.users, args.logins, args.signups, args.threads)
+
+
+if __name__ == "__main__":
+    main()
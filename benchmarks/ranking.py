@@ -0,0 +1,60 @@
+"""Per-query latency of the old sort-based ranking against `top_n`.
+
+    $ python -m benchmarks.ranking
+"""
+import argparse
+import time
+
+import numpy as np
+
+from neighbors import top_n
+
+
+def sorted_ranking(row, n):
+    """The ranking content_recommendation used to do on every click"""
+    sim_scores = list(enumerate(row))
+    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+    sim_scores = sim_scores[1 : n + 1]
+    return [i[0] for i in sim_scores]
+
+
+def per_query(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def run(sizes, n, queries, batch):
+    rng = np.random.default_rng(0)
+    print("{:>8} {:>14} {:>14} {:>16} {:>8}".format(
+        "items", "sorted (ms)", "top_n (ms)", "top_n batch (ms)", "speedup"
+    ))
+    for size in sizes:
+        scores = rng.random((queries, size))
+        rows = rng.integers(0, size, queries)
+        old = per_query(lambda q: sorted_ranking(scores[q], n), range(queries))
+        new = per_query(lambda q: top_n(scores[q], n, exclude=rows[q]), range(queries))
+
+        start = time.perf_counter()
+        for lo in range(0, queries, batch):
+            top_n(scores[lo : lo + batch], n, exclude=rows[lo : lo + batch])
+        batched = (time.perf_counter() - start) / queries
+
+        print("{:>8} {:>14.3f} {:>14.3f} {:>16.3f} {:>7.0f}x".format(
+            size, old * 1e3, new * 1e3, batched * 1e3, old / new
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("-n", type=int, default=25)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=10)
+    args = parser.parse_args()
+    run(args.sizes, args.n, args.queries, args.batch)
+
+
+if __name__ == "__main__":
+    main()
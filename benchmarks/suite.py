@@ -0,0 +1,223 @@
+"""Time and peak memory of every serving stage on synthetic catalogs.
+
+For each scale a catalog is generated (benchmarks.synthetic). One fresh
+interpreter converts it and builds the content model, and a second one
+runs the app's serving stages in order, so the build's memory never
+shows up in theirs. Every stage records its wall time, the resident
+memory after it and its own peak (the high-water mark is reset before
+each stage). Streamlit's caches are inactive outside `streamlit run`, so
+the models are loaded once and the recommenders are timed on their
+uncached bodies, as a warm server runs them.
+
+    $ python -m benchmarks.suite --scales 1000 10000 100000 --json bench.json
+    $ python -m benchmarks.suite --scales 1000000 --backend ann
+    $ python -m benchmarks.suite --baseline bench.json
+
+With --baseline every stage is also printed relative to an earlier run,
+e.g. the JSON of the previous commit.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = [1_000, 10_000, 100_000]
+# exact neighbors cost O(N^2); beyond this the ANN backend is used
+EXACT_LIMIT = 50_000
+QUERIES = 200
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def reset_peak_rss():
+    """Restart the peak_rss_mb high-water mark from the current RSS"""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 2**10
+
+
+def measure(phase, backend, queries):
+    """Run the stages of `phase` in this process (cwd is a synthetic app directory).
+
+    "build" converts the catalog and builds the content model, "serve"
+    loads them and runs the recommenders. Each stage's numbers are printed
+    as a JSON line when it finishes.
+    """
+    import numpy as np
+
+    import catalog
+    import content_model
+    import main
+    from recommenders import popular, similar, similar_popular
+    from title_search import title_index
+
+    def stage(name, fn, calls=1):
+        reset_peak_rss()
+        start = time.perf_counter()
+        for _ in range(calls):
+            result = fn()
+        elapsed = time.perf_counter() - start
+        # one line per stage, so a run killed halfway still reports its progress
+        print(json.dumps({
+            "stage": name,
+            "seconds": elapsed,
+            "ms_per_call": elapsed / calls * 1e3,
+            "calls": calls,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        }), flush=True)
+        return result
+
+    if phase == "build":
+        stage("catalog.convert", catalog.convert_catalog)
+        stage("content_model.build", lambda: content_model.build(backend=backend, force=True))
+        return
+
+    books = stage("read_book_data", main.read_book_data)
+    neighbors = stage("content", lambda: main.content(books))
+
+    rng = np.random.default_rng(0)
+    book_ids = iter(rng.choice(books["book_id"].to_numpy(), queries * 2))
+    # what a user types: the first few letters of a title's first words
+    prefixes = iter([" ".join(w[:4] for w in str(t).split()[:2])
+                     for t in rng.choice(books["title"].to_numpy(), queries)])
+    index = title_index(books)
+
+    stage("title_search", lambda: index.search(next(prefixes), fuzzy=True), queries)
+    stage("simple_recommender", lambda: popular(books, 10), queries)
+    stage("content_recommendation",
+          lambda: similar(books, neighbors, next(book_ids), 10), queries)
+    stage("improved_recommendation",
+          lambda: similar_popular(books, neighbors, next(book_ids), 10), queries)
+
+
+def run_scale(n_books, data_dir, backend, queries):
+    from benchmarks.synthetic import generate
+
+    app = os.path.join(data_dir, str(n_books))
+    csv = os.path.join(app, "data", "books_cleaned.csv")
+    if not os.path.exists(csv):
+        start = time.perf_counter()
+        generate(n_books, csv)
+        print("generated {} books in {:.1f}s".format(n_books, time.perf_counter() - start))
+
+    stages = []
+    for phase in ("build", "serve"):
+        phase_stages, error = run_phase(phase, app, backend, queries)
+        stages += phase_stages
+        if error is not None:
+            return stages, error
+    return stages, None
+
+
+def run_phase(phase, app, backend, queries):
+    """Run `measure(phase)` in a fresh interpreter; returns (stages, error)"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--measure", phase, "--backend", backend,
+         "--queries", str(queries)],
+        capture_output=True, text=True, cwd=app, env=env,
+    )
+    stages = [json.loads(line) for line in proc.stdout.splitlines() if line.startswith('{"stage"')]
+    error = None
+    if proc.returncode < 0:
+        # most likely the OOM killer: a result in itself
+        error = "killed by signal {}".format(-proc.returncode)
+    elif proc.returncode > 0:
+        lines = proc.stderr.strip().splitlines()
+        error = lines[-1] if lines else "exit code {}".format(proc.returncode)
+    return stages, error
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True,
+            text=True, cwd=ROOT,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, data_dir, backend, queries, baseline=None):
+    previous = {}
+    if baseline is not None:
+        previous = {(r["books"], r["stage"]): r for r in baseline["results"] if "stage" in r}
+
+    print("{:>9} {:<24} {:>11} {:>11} {:>10} {:>10}".format(
+        "books", "stage", "total (s)", "ms / call", "RSS (MB)", "peak (MB)"
+    ) + ("  vs baseline" if previous else ""))
+    results = []
+    for n_books in scales:
+        scale_backend = backend or ("exact" if n_books <= EXACT_LIMIT else "ann")
+        stages, error = run_scale(n_books, data_dir, scale_backend, queries)
+        for r in stages:
+            r = dict(r, books=n_books, backend=scale_backend)
+            results.append(r)
+            line = "{:>9} {:<24} {:>11.3f} {:>11.3f} {:>10.1f} {:>10.1f}".format(
+                n_books, r["stage"], r["seconds"], r["ms_per_call"], r["rss_mb"], r["peak_rss_mb"]
+            )
+            old = previous.get((n_books, r["stage"]))
+            if old is not None and old["ms_per_call"] > 0:
+                line += "  {:>10.2f}x".format(r["ms_per_call"] / old["ms_per_call"])
+            print(line)
+        if error is not None:
+            results.append({"books": n_books, "backend": scale_backend, "error": error})
+            print("{:>9} failed after {} stages: {}".format(n_books, len(stages), error))
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "queries": queries,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--backend", choices=["exact", "ann"],
+                        help="content model backend (default: exact up to {} books)".format(EXACT_LIMIT))
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("--data-dir", help="keep generated catalogs here between runs")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare against")
+    parser.add_argument("--measure", choices=["build", "serve"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.backend, args.queries)
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.data_dir:
+        report = run(args.scales, os.path.abspath(args.data_dir), args.backend, args.queries, baseline)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run(args.scales, tmp, args.backend, args.queries, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
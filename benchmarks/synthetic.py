@@ -0,0 +1,111 @@
+"""Synthetic catalogs shaped like data/books_cleaned.csv.
+
+Titles, authors, genres and descriptions have realistic lengths, words
+follow a Zipf distribution (so TF-IDF sparsity resembles real text) and
+ratings_count is heavy-tailed, as a few bestsellers dominate real ratings:
+
+    $ python -m benchmarks.synthetic 100000 --out /tmp/books_100k.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["book_id", "title", "authors", "genres", "description",
+           "average_rating", "ratings_count", "book_counts"]
+GENRES = [
+    "fiction", "fantasy", "romance", "youngadult", "mystery", "thriller", "classics",
+    "historicalfiction", "sciencefiction", "nonfiction", "contemporary", "horror",
+    "paranormal", "crime", "biography", "history", "poetry", "comics", "graphicnovels",
+    "childrens", "humor", "philosophy", "christian", "memoir", "selfhelp", "science",
+    "travel", "sports", "music", "art", "business", "psychology", "suspense", "chicklit",
+    "manga", "spirituality", "cookbooks", "lgbt", "adventure", "dystopia",
+]
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vor", "sha", "el", "in", "dra", "qu", "an",
+             "mor", "lis", "ter", "ba", "nu", "gre", "so", "ith", "pa", "wen", "dal", "ro"]
+VOCABULARY = 20_000
+CHUNK = 50_000
+
+
+def vocabulary(size, rng):
+    """`size` distinct pseudo-words of two to four syllables"""
+    words = set()
+    while len(words) < size:
+        n = rng.integers(2, 5, size)
+        picks = rng.integers(0, len(SYLLABLES), (size, 4))
+        words.update("".join(SYLLABLES[s] for s in p[:k]) for p, k in zip(picks, n))
+    return np.array(sorted(words)[:size], dtype=object)
+
+
+def zipf_p(size, s=1.0):
+    """Probabilities of ranks 1..size under a Zipf law with exponent s"""
+    p = 1 / np.arange(1, size + 1) ** s
+    return p / p.sum()
+
+
+def zipf_words(rng, words, lengths):
+    """One string per entry of `lengths`, of Zipf-distributed words"""
+    draws = rng.choice(len(words), lengths.sum(), p=zipf_p(len(words)))
+    parts = np.split(words[draws], np.cumsum(lengths)[:-1])
+    return [" ".join(part) for part in parts]
+
+
+def books_chunk(start, n, rng, words, authors):
+    ids = np.arange(start + 1, start + n + 1)
+    titles = [t.title() for t in zipf_words(rng, words, rng.integers(1, 7, n))]
+    # about one book in five belongs to a series
+    series = rng.random(n) < 0.2
+    for i in np.flatnonzero(series):
+        titles[i] = "{} ({}, #{})".format(titles[i], titles[i].split()[0], rng.integers(1, 8))
+
+    genres = [
+        ", ".join(rng.choice(GENRES, k, replace=False)) for k in rng.integers(2, 7, n)
+    ]
+    ratings_count = np.rint(rng.pareto(1.2, n) * 100 + 1).astype(np.int64)
+    return pd.DataFrame({
+        "book_id": ids,
+        "title": titles,
+        # a few prolific authors, many with a single book
+        "authors": authors[rng.choice(len(authors), n, p=zipf_p(len(authors), 0.8))],
+        "genres": genres,
+        "description": zipf_words(rng, words, rng.integers(40, 260, n)),
+        "average_rating": np.clip(rng.normal(3.95, 0.3, n), 1, 5).round(2),
+        "ratings_count": ratings_count,
+        "book_counts": np.maximum(1, rng.poisson(np.sqrt(ratings_count) / 4)),
+    }, columns=COLUMNS)
+
+
+def generate(n, path, seed=0, chunk=CHUNK):
+    """Write an n-book catalog to `path`, chunk by chunk to bound memory"""
+    rng = np.random.default_rng(seed)
+    words = vocabulary(VOCABULARY, rng)
+    names = vocabulary(2000, rng)
+    n_authors = max(100, n // 3)
+    authors = np.array(
+        ["{} {}".format(a.title(), b.title())
+         for a, b in zip(rng.choice(names, n_authors), rng.choice(names, n_authors))],
+        dtype=object,
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    for start in range(0, n, chunk):
+        books = books_chunk(start, min(chunk, n - start), rng, words, authors)
+        books.to_csv(tmp, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("books", type=int)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.books, args.out, args.seed)
+    print("wrote {} ({} books)".format(args.out, args.books))
+
+
+if __name__ == "__main__":
+    main()
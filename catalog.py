@@ -0,0 +1,240 @@
+"""Book catalog loading.
+
+`data/books_cleaned.csv` is the source of truth. For serving it is
+converted to a columnar layout, one .npy file per column, so a process
+only reads (and keeps in memory) the columns it asks for:
+
+    $ python catalog.py convert
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from publish import publishing, resolve
+
+CATALOG_PATH = "data/books_cleaned.csv"
+COLUMNAR_PATH = "data/catalog"
+FORMAT_VERSION = 1
+
+# what the UI and the recommenders need; the free text is only read to
+# fit the content model
+UI_COLUMNS = ["book_id", "title", "authors", "average_rating", "ratings_count"]
+TEXT_COLUMNS = ["genres", "description"]
+CATEGORY_COLUMNS = ["title", "authors"]
+
+
+def catalog_version(path=CATALOG_PATH):
+    """Return a short content hash of the catalog file, or None if it is missing"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _compact(values):
+    """Downcast a numeric column to int32/float32 where it fits"""
+    if values.dtype.kind == "f":
+        return values.astype(np.float32)
+    if values.dtype.kind in "iu":
+        info = np.iinfo(np.int32)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(np.int32)
+    return values
+
+
+def save_strings(path, name, values):
+    """Save strings as one UTF-8 blob plus int64 offsets; None marks a missing value"""
+    missing = np.array([v is None for v in values], dtype=bool)
+    encoded = [b"" if v is None else v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(path, name + ".blob.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(path, name + ".offsets.npy"), offsets)
+    np.save(os.path.join(path, name + ".missing.npy"), missing)
+
+
+class StringArray:
+    """Read-only sequence of strings saved by `save_strings`.
+
+    The blob and offsets stay memory-mapped; a string is only decoded
+    when it is accessed.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path, name):
+        return cls(
+            np.load(os.path.join(path, name + ".blob.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, name + ".offsets.npy"), mmap_mode="r"),
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        i = range(len(self))[i]
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for lo, hi in zip(offsets, offsets[1:]):
+            yield data[lo:hi].decode("utf-8")
+
+
+def _load_strings(path, name):
+    blob = np.load(os.path.join(path, name + ".blob.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(path, name + ".offsets.npy"))
+    missing = np.load(os.path.join(path, name + ".missing.npy"))
+    data = blob.tobytes()
+    return np.array(
+        [
+            None if missing[i] else data[offsets[i] : offsets[i + 1]].decode("utf-8")
+            for i in range(len(missing))
+        ],
+        dtype=object,
+    )
+
+
+def convert_catalog(csv_path=CATALOG_PATH, path=COLUMNAR_PATH):
+    """Convert the CSV catalog to the columnar layout at `path`"""
+    books = pd.read_csv(csv_path)
+    with publishing(path) as out:
+        columns = {}
+        for name in books.columns:
+            column = books[name]
+            if column.dtype.kind in "biuf":
+                values = _compact(column.to_numpy())
+                np.save(os.path.join(out, name + ".npy"), values)
+                columns[name] = {"kind": "numeric", "dtype": values.dtype.str}
+            elif name in CATEGORY_COLUMNS:
+                categorical = pd.Categorical(column)
+                np.save(os.path.join(out, name + ".codes.npy"), categorical.codes.astype(np.int32))
+                save_strings(out, name + ".categories", list(categorical.categories.astype(str)))
+                columns[name] = {"kind": "category"}
+            else:
+                values = [None if pd.isna(v) else str(v) for v in column]
+                save_strings(out, name, values)
+                columns[name] = {"kind": "text"}
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "catalog_version": catalog_version(csv_path),
+            "source": _source_stat(csv_path),
+            "rows": len(books),
+            "columns": columns,
+        }
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def read_manifest(path=COLUMNAR_PATH):
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def is_current(manifest, csv_path=CATALOG_PATH):
+    """Whether a columnar catalog is usable in place of `csv_path`.
+
+    Uses the CSV's size and mtime rather than its hash so the check costs
+    one stat call.
+    """
+    if manifest is None or manifest["format"] != FORMAT_VERSION:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return manifest["source"] == _source_stat(csv_path)
+
+
+def read_columnar(path=COLUMNAR_PATH, columns=None):
+    """Load the columnar catalog, reading only `columns` (all if None)"""
+    # read one build throughout, even if a new one is published meanwhile
+    path = resolve(path)
+    manifest = read_manifest(path)
+    names = list(manifest["columns"]) if columns is None else columns
+
+    data = {}
+    for name in names:
+        kind = manifest["columns"][name]["kind"]
+        if kind == "numeric":
+            data[name] = np.load(os.path.join(path, name + ".npy"))
+        elif kind == "category":
+            codes = np.load(os.path.join(path, name + ".codes.npy"))
+            categories = _load_strings(path, name + ".categories")
+            data[name] = pd.Categorical.from_codes(codes, categories=categories)
+        else:
+            data[name] = _load_strings(path, name)
+
+    books = pd.DataFrame(data, columns=names)
+    books.attrs["catalog_version"] = manifest["catalog_version"]
+    return books
+
+
+def catalog_fingerprint(path=CATALOG_PATH, columnar_path=COLUMNAR_PATH):
+    """Cheap identifier of the catalog `read_catalog` would load right now.
+
+    This is the columnar copy's recorded version when it is current, else
+    the CSV's size and mtime; it costs a stat call and a small JSON read
+    instead of hashing the file. None if there is no catalog at all.
+    """
+    manifest = read_manifest(columnar_path)
+    if is_current(manifest, path):
+        return manifest["catalog_version"]
+    if not os.path.exists(path):
+        return None
+    stat = _source_stat(path)
+    return "{size}-{mtime_ns}".format(**stat)
+
+
+def read_catalog(path=CATALOG_PATH, columns=None, columnar_path=COLUMNAR_PATH):
+    """Read the book catalog and tag it with its version in `books.attrs`.
+
+    The columnar copy is used when it is up to date, otherwise the CSV is
+    parsed (`usecols=columns`).
+    """
+    if is_current(read_manifest(columnar_path), path):
+        return read_columnar(columnar_path, columns)
+    books = pd.read_csv(path, usecols=columns)
+    books.attrs["catalog_version"] = catalog_version(path)
+    return books
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="write the columnar copy of the CSV")
+    convert.add_argument("--catalog", default=CATALOG_PATH)
+    convert.add_argument("--out", default=COLUMNAR_PATH)
+    convert.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if not args.force and is_current(read_manifest(args.out), args.catalog):
+            print("{} is up to date".format(args.out))
+            return
+        manifest = convert_catalog(args.catalog, args.out)
+        print("wrote {} ({} books)".format(args.out, manifest["rows"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Collaborative filtering: matrix factorization of the user ratings.
+
+Training is an offline job over the ingested ratings that writes float32
+user/item factor arrays next to the content model:
+
+    $ python ratings.py ingest
+    $ python collab.py train
+
+Serving scores every book for a user with one matrix-vector product.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.utils.extmath import randomized_svd
+
+from neighbors import top_n
+from publish import publishing, resolve
+from ratings import ARTIFACT_DIR as RATINGS_DIR
+from ratings import load_ratings
+
+# bump whenever the on-disk layout changes
+FORMAT_VERSION = 2
+ARTIFACT_DIR = "artifacts/collab-v{}".format(FORMAT_VERSION)
+
+FACTORS = 50
+# shrinks the bias of rarely rated books towards the global mean
+BIAS_REG = 25
+
+
+class CollabModel:
+    """Factorized ratings model.
+
+    A user's predicted rating of the book in catalog row `i` is
+    `mean + item_bias[i] + user_factors[u] @ item_factors[i]`, where `u` is
+    the user's row in `ratings`.
+    """
+
+    def __init__(self, ratings, user_factors, item_factors, item_bias, mean, version=None):
+        self.ratings = ratings
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.item_bias = item_bias
+        self.mean = mean
+        self.version = version
+
+    def user_row(self, user_id):
+        """Return the factor row of `user_id`, or None for an unknown user"""
+        return self.ratings.user_row(user_id)
+
+    def book_read(self, user_id):
+        """Take user_id and return the catalog rows of the books that user has read"""
+        return self.ratings.books_read(user_id)
+
+    def recommend(self, user_id, n=5):
+        """Return (rows, predicted ratings) of the n best unread books for user_id"""
+        row = self.user_row(user_id)
+        if row is None:
+            raise KeyError(user_id)
+        scores = self.item_factors @ self.user_factors[row] + self.item_bias
+        scores[self.book_read(user_id)] = -np.inf
+        rows, best = top_n(scores, n)
+        keep = np.isfinite(best[0])
+        return rows[0][keep], best[0][keep] + self.mean
+
+
+def train(ratings, factors=FACTORS):
+    """Factorize the rating residuals left after the global mean and item biases"""
+    coo = ratings.csr.tocoo()
+    n_items = ratings.shape[1]
+    data = coo.data.astype(np.float64)
+    mean = float(data.mean())
+
+    counts = np.bincount(coo.col, minlength=n_items)
+    sums = np.bincount(coo.col, weights=data - mean, minlength=n_items)
+    item_bias = sums / (counts + BIAS_REG)
+
+    residual = sp.csr_matrix(
+        (data - mean - item_bias[coo.col], (coo.row, coo.col)), shape=ratings.shape
+    )
+    factors = min(factors, min(ratings.shape) - 1)
+    U, S, Vt = randomized_svd(residual, factors, random_state=0)
+
+    return CollabModel(
+        ratings=ratings,
+        user_factors=(U * S).astype(np.float32),
+        item_factors=np.ascontiguousarray(Vt.T, dtype=np.float32),
+        item_bias=item_bias.astype(np.float32),
+        mean=mean,
+        version=ratings.version,
+    )
+
+
+def save_collab(model, path=ARTIFACT_DIR):
+    """Write `model` to `path`, replacing any previous artifact atomically.
+
+    The ratings themselves are not copied; they stay in the ratings artifact.
+    """
+    with publishing(path) as out:
+        arrays = {
+            "user_factors": model.user_factors,
+            "item_factors": model.item_factors,
+            "item_bias": model.item_bias,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(out, name + ".npy"), array)
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "catalog_version": model.version,
+            "mean": model.mean,
+            "factors": model.user_factors.shape[1],
+            # the factor rows follow the user rows of this ingest only
+            "ingest_id": model.ratings.ingest_id,
+        }
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+
+def load_collab(path=ARTIFACT_DIR, version=None, ratings_path=RATINGS_DIR):
+    """Open a saved model, and the ratings it was trained on, with memory-mapping.
+
+    Returns None if either artifact is missing, if `version` is given and
+    they were built against a different catalog, or if the ratings were
+    re-ingested after training.
+    """
+    path = resolve(path)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest["format"] != FORMAT_VERSION:
+        return None
+    if version is not None and manifest["catalog_version"] != version:
+        return None
+    ratings = load_ratings(ratings_path, manifest["catalog_version"])
+    if ratings is None or ratings.ingest_id != manifest["ingest_id"]:
+        return None
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    return CollabModel(
+        ratings=ratings,
+        user_factors=load("user_factors"),
+        item_factors=load("item_factors"),
+        item_bias=load("item_bias"),
+        mean=manifest["mean"],
+        version=manifest["catalog_version"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="factorize the ratings and save the model")
+    train_cmd.add_argument("--ratings", default=RATINGS_DIR, help="output of `ratings.py ingest`")
+    train_cmd.add_argument("--out", default=ARTIFACT_DIR)
+    train_cmd.add_argument("--factors", type=int, default=FACTORS)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        ratings = load_ratings(args.ratings)
+        if ratings is None:
+            parser.error("no ratings at {}, run `python ratings.py ingest` first".format(args.ratings))
+        model = train(ratings, args.factors)
+        save_collab(model, args.out)
+        print("wrote {} ({} users, {} books)".format(args.out, *ratings.shape))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""Content-based model: TF-IDF vectors and top-K neighbor table.
+
+The model is fitted offline and saved as a directory of .npy files that
+the app opens with memory-mapping, so every worker process shares a
+single physical copy through the page cache:
+
+    $ python content_model.py build
+
+When the catalog changes, `build` only re-vectorizes the new or changed
+books against the existing vocabulary and patches the neighbor lists they
+affect. The vocabulary is refit once too many words of the updated books
+are unknown to it. The idf weights are left alone until
+
+    $ python content_model.py refresh-idf
+
+re-weights the matrix with the current document frequencies (e.g. nightly).
+"""
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from ann import N_PROBE, build_ann_neighbor_index
+from catalog import CATALOG_PATH, StringArray, catalog_version, read_catalog, save_strings
+from neighbors import NEIGHBORS, NeighborIndex, build_neighbor_index, rows_per_block, top_n
+from publish import publishing, resolve
+
+# bump whenever the on-disk layout or the fitting parameters change
+FORMAT_VERSION = 4
+ARTIFACT_DIR = "artifacts/content-v{}".format(FORMAT_VERSION)
+
+# "exact" compares every pair of books, "ann" only each book's candidates
+# from an approximate index (see ann.py); use "ann" for large catalogs
+BACKENDS = ("exact", "ann")
+BACKEND = "exact"
+
+# share of the words in incrementally added books that the vocabulary does
+# not know, above which the whole model is refit
+DRIFT_THRESHOLD = 0.2
+
+
+class ContentModel:
+    """Fitted content model.
+
+    `terms` and `idf` describe the vectorizer, `matrix` holds the
+    l2-normalized TF-IDF row of every book, `neighbors` its top-K table and
+    `index` maps a title to its row (built on first use for a loaded model). `row_hashes` fingerprint the text of
+    every row, to find the rows a catalog change touched, and `drift`
+    counts (unknown, total) words added by incremental updates. `n_probe`
+    is the ann backend's search width (None for exact).
+    """
+
+    def __init__(self, terms, idf, matrix, neighbors, index, version=None,
+                 backend=BACKEND, row_hashes=None, drift=(0, 0), n_probe=None):
+        self.terms = terms
+        self.idf = idf
+        self.matrix = matrix
+        self.neighbors = neighbors
+        self._index = index
+        self.version = version
+        self.backend = backend
+        self.row_hashes = row_hashes
+        self.drift = drift
+        self.n_probe = n_probe
+
+    @property
+    def index(self):
+        if callable(self._index):
+            self._index = self._index()
+        return self._index
+
+
+def book_content(books):
+    """Return the text the content model is fitted on, one string per book"""
+    return pd.Series(
+        books[["authors", "title", "genres", "description"]]
+        .astype(object)
+        .fillna("")
+        .values.tolist(),
+        index=books.index,
+    ).str.join(" ")
+
+
+def row_hashes(books):
+    return pd.util.hash_pandas_object(book_content(books), index=False).to_numpy()
+
+
+def make_vectorizer():
+    return TfidfVectorizer(
+        analyzer="word", ngram_range=(1, 2), min_df=1, stop_words="english"
+    )
+
+
+def fitted_vectorizer(model):
+    """Rebuild the fitted vectorizer of `model` from its terms and idf"""
+    vectorizer = make_vectorizer()
+    vectorizer.vocabulary_ = {term: col for col, term in enumerate(model.terms)}
+    vectorizer.idf_ = np.asarray(model.idf)
+    return vectorizer
+
+
+def _neighbor_index(matrix, k, backend, n_probe):
+    if backend == "ann":
+        return build_ann_neighbor_index(matrix, k=k, n_probe=n_probe)
+    return build_neighbor_index(matrix, k=k)
+
+
+def fit_content(books, k=NEIGHBORS, backend=BACKEND, n_probe=N_PROBE):
+    """Fit the TF-IDF vectorizer on `books` and build its neighbor table"""
+    vectorizer = make_vectorizer()
+    matrix = vectorizer.fit_transform(book_content(books)).astype(np.float32)
+    n_probe = n_probe if backend == "ann" else None
+    neighbors = _neighbor_index(matrix, k, backend, n_probe)
+    index = pd.Series(books.index, index=books["title"])
+    return ContentModel(
+        terms=vectorizer.get_feature_names_out(),
+        idf=vectorizer.idf_,
+        matrix=matrix,
+        neighbors=neighbors,
+        index=index,
+        version=books.attrs.get("catalog_version"),
+        backend=backend,
+        row_hashes=row_hashes(books),
+        n_probe=n_probe,
+    )
+
+
+def changed_rows(model, books):
+    """Catalog rows of `books` whose text differs from what `model` was fitted on.
+
+    Returns None when books were removed, which cannot be patched in place.
+    """
+    n_old = len(model.row_hashes)
+    if len(books) < n_old:
+        return None
+    hashes = row_hashes(books)
+    changed = np.flatnonzero(hashes[:n_old] != model.row_hashes)
+    return np.concatenate([changed, np.arange(n_old, len(books))])
+
+
+def _replace_rows(matrix, rows, vectors, n_rows):
+    """Return `matrix` grown to n_rows with `rows` set to `vectors`"""
+    keep = np.ones(n_rows, dtype=np.float32)
+    keep[rows] = 0
+    grown = sp.vstack(
+        [matrix, sp.csr_matrix((n_rows - matrix.shape[0], matrix.shape[1]), dtype=np.float32)]
+    )
+    scatter = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, np.arange(len(rows)))),
+        shape=(n_rows, len(rows)),
+    )
+    return (sp.diags(keep) @ grown + scatter @ vectors).tocsr().astype(np.float32)
+
+
+def _merge(ids, scores, cand_ids, cand_scores, k):
+    """Keep the k best of the existing lists and new candidates, row by row"""
+    all_ids = np.concatenate([ids, cand_ids], axis=1)
+    all_scores = np.concatenate([scores, cand_scores], axis=1)
+    ranked = np.where(all_ids >= 0, all_scores, -np.inf)
+    order = np.argsort(-ranked, axis=1, kind="stable")[:, :k]
+    return (
+        np.take_along_axis(all_ids, order, axis=1),
+        np.take_along_axis(all_scores, order, axis=1),
+    )
+
+
+def update_content(model, books, rows, drift_threshold=DRIFT_THRESHOLD):
+    """Patch `model` for the new or changed catalog `rows` of `books`.
+
+    The rows are vectorized with the existing vocabulary and idf, and only
+    their similarities to the catalog are computed. Each changed row gets a
+    fresh neighbor list. Rows whose list pointed at a changed row are
+    recomputed, and all other lists merge in the changed rows as candidates.
+    The cost grows with len(rows), not with the catalog size squared.
+
+    Returns None when the vocabulary has drifted past `drift_threshold` and
+    the model should be refit instead.
+    """
+    vectorizer = fitted_vectorizer(model)
+    texts = book_content(books.iloc[rows])
+    analyzer = vectorizer.build_analyzer()
+    unknown, total = model.drift
+    for text in texts:
+        words = analyzer(text)
+        total += len(words)
+        unknown += sum(word not in vectorizer.vocabulary_ for word in words)
+    if total and unknown / total > drift_threshold:
+        return None
+
+    n_rows = len(books)
+    k = model.neighbors.k
+    matrix = _replace_rows(
+        model.matrix.tocsr(), rows, vectorizer.transform(texts).astype(np.float32), n_rows
+    )
+    matrix_t = matrix.T.tocsc()
+
+    ids = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.full((n_rows, k), np.nan, dtype=np.float32)
+    n_old = len(model.neighbors)
+    ids[:n_old] = model.neighbors.ids
+    scores[:n_old] = model.neighbors.scores
+
+    stale = np.isin(ids, rows).any(axis=1)
+    stale[rows] = True
+    recompute = np.flatnonzero(stale)
+    block_size = rows_per_block(n_rows)
+    for start in range(0, len(recompute), block_size):
+        block = recompute[start : start + block_size]
+        sims = (matrix[block] @ matrix_t).toarray()
+        ids[block], scores[block] = top_n(sims, k, exclude=block)
+
+    others = np.flatnonzero(~stale)
+    for start in range(0, len(rows), block_size):
+        block = rows[start : start + block_size]
+        sims = (matrix[others] @ matrix_t[:, block]).toarray()
+        cand_ids = np.broadcast_to(block.astype(np.int32), sims.shape)
+        ids[others], scores[others] = _merge(ids[others], scores[others], cand_ids, sims, k)
+
+    index = model.index[~np.isin(model.index.values, rows)]
+    index = pd.concat([index, pd.Series(rows, index=books["title"].iloc[rows].values)])
+
+    hashes = np.empty(n_rows, dtype=np.uint64)
+    hashes[:n_old] = model.row_hashes
+    hashes[rows] = row_hashes(books.iloc[rows])
+
+    return ContentModel(
+        terms=model.terms,
+        idf=model.idf,
+        matrix=matrix,
+        neighbors=NeighborIndex(ids, scores),
+        index=index,
+        version=books.attrs.get("catalog_version"),
+        backend=model.backend,
+        row_hashes=hashes,
+        drift=(unknown, total),
+        n_probe=model.n_probe,
+    )
+
+
+def refresh_idf(model):
+    """Re-weight `model` with the document frequencies of the current catalog.
+
+    New books are vectorized with the idf of the last fit; this recomputes
+    idf from the matrix (a term's document frequency is its number of
+    non-zero rows), rescales every row and rebuilds the neighbor table.
+    """
+    matrix = model.matrix.tocsr()
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    # TfidfVectorizer's smooth idf
+    idf = np.log((1 + matrix.shape[0]) / (1 + df)) + 1
+    matrix = normalize(matrix @ sp.diags(idf / np.asarray(model.idf))).astype(np.float32)
+    neighbors = _neighbor_index(matrix, model.neighbors.k, model.backend, model.n_probe)
+    return ContentModel(
+        terms=model.terms,
+        idf=idf,
+        matrix=matrix,
+        neighbors=neighbors,
+        index=model.index,
+        version=model.version,
+        backend=model.backend,
+        row_hashes=model.row_hashes,
+        drift=model.drift,
+        n_probe=model.n_probe,
+    )
+
+
+def save_content(model, path=ARTIFACT_DIR):
+    """Write `model` to `path`, replacing any previous artifact atomically"""
+    with publishing(path) as out:
+        matrix = model.matrix.tocsr()
+        arrays = {
+            "idf": np.asarray(model.idf),
+            "matrix_data": matrix.data.astype(np.float32),
+            "matrix_indices": matrix.indices,
+            "matrix_indptr": matrix.indptr,
+            "neighbor_ids": model.neighbors.ids,
+            "neighbor_scores": model.neighbors.scores,
+            "row_hashes": model.row_hashes,
+            "index_rows": np.asarray(model.index.values, dtype=np.int32),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(out, name + ".npy"), array)
+        # strings as a UTF-8 blob plus offsets, so they are mmapped like the rest
+        save_strings(out, "terms", list(model.terms))
+        save_strings(out, "index_titles", [str(title) for title in model.index.index])
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "catalog_version": model.version,
+            "shape": list(matrix.shape),
+            "k": model.neighbors.k,
+            "backend": model.backend,
+            "n_probe": model.n_probe,
+            "drift": list(model.drift),
+            # new for every save, so caches notice a rebuild of the same catalog
+            "build_id": uuid.uuid4().hex,
+        }
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+
+def read_manifest(path=ARTIFACT_DIR):
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def build_id(path=ARTIFACT_DIR):
+    """Id of the saved artifact's build, or None if there is none"""
+    manifest = read_manifest(path)
+    return None if manifest is None else manifest.get("build_id")
+
+
+def load_content(path=ARTIFACT_DIR, version=None):
+    """Open a saved model with memory-mapping.
+
+    Returns None if there is no artifact at `path`, or if `version` is given
+    and the artifact was built from a different catalog.
+    """
+    # every file below is read from the build the link points to now
+    path = resolve(path)
+    manifest = read_manifest(path)
+    if manifest is None or manifest["format"] != FORMAT_VERSION:
+        return None
+    if version is not None and manifest["catalog_version"] != version:
+        return None
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    matrix = sp.csr_matrix(
+        (load("matrix_data"), load("matrix_indices"), load("matrix_indptr")),
+        shape=tuple(manifest["shape"]),
+        copy=False,
+    )
+    index_rows = load("index_rows")
+    index_titles = StringArray.load(path, "index_titles")
+    return ContentModel(
+        terms=StringArray.load(path, "terms"),
+        idf=load("idf"),
+        matrix=matrix,
+        neighbors=NeighborIndex(load("neighbor_ids"), load("neighbor_scores")),
+        index=lambda: pd.Series(index_rows, index=list(index_titles)),
+        version=manifest["catalog_version"],
+        backend=manifest["backend"],
+        row_hashes=load("row_hashes"),
+        drift=tuple(manifest["drift"]),
+        n_probe=manifest.get("n_probe"),
+    )
+
+
+def build(catalog=CATALOG_PATH, path=ARTIFACT_DIR, force=False, backend=None, n_probe=None):
+    """Bring the saved model up to date with the catalog.
+
+    An artifact for an older catalog is patched with update_content when
+    possible; otherwise (or with force) the model is fitted from scratch.
+    `backend` and `n_probe` default to the saved artifact's, so a plain
+    rebuild keeps them.
+    """
+    manifest = read_manifest(path)
+    if manifest is not None and manifest["format"] != FORMAT_VERSION:
+        manifest = None
+    if backend is None:
+        backend = BACKEND if manifest is None else manifest["backend"]
+    if backend != "ann":
+        n_probe = None
+    elif n_probe is None:
+        n_probe = (manifest or {}).get("n_probe") or N_PROBE
+    compatible = (
+        manifest is not None
+        and manifest["backend"] == backend
+        and manifest.get("n_probe") == n_probe
+    )
+    if not force and compatible and manifest["catalog_version"] == catalog_version(catalog):
+        print("{} is up to date".format(path))
+        return
+
+    books = read_catalog(catalog)
+    model = None
+    if not force and compatible:
+        previous = load_content(path)
+        rows = changed_rows(previous, books)
+        if rows is not None:
+            model = update_content(previous, books, rows)
+    if model is not None:
+        print("updated {} ({} changed books)".format(path, len(rows)))
+    else:
+        model = fit_content(books, backend=backend, n_probe=n_probe)
+        print("fitted {} ({} books, {} backend)".format(path, len(books), backend))
+    save_content(model, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="fit the model and save it to disk")
+    build_cmd.add_argument("--catalog", default=CATALOG_PATH)
+    build_cmd.add_argument("--out", default=ARTIFACT_DIR)
+    build_cmd.add_argument("--force", action="store_true", help="refit from scratch")
+    build_cmd.add_argument("--backend", choices=BACKENDS,
+                           help="default: the saved model's, or {}".format(BACKEND))
+    build_cmd.add_argument("--n-probe", type=int,
+                           help="lists the ann backend searches (default: the saved model's, or {})".format(N_PROBE))
+    refresh_cmd = sub.add_parser("refresh-idf", help="re-weight the saved model with current idf")
+    refresh_cmd.add_argument("--out", default=ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.catalog, args.out, args.force, args.backend, args.n_probe)
+    elif args.command == "refresh-idf":
+        model = load_content(args.out)
+        if model is None:
+            parser.error("no model at {}, run `python content_model.py build` first".format(args.out))
+        save_content(refresh_idf(model), args.out)
+        print("refreshed {}".format(args.out))
+
+
+if __name__ == "__main__":
+    main()
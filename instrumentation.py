@@ -0,0 +1,254 @@
+"""Latency, counter and memory metrics for the recommendation path.
+
+Off by default; set BOOKS_INSTRUMENTATION=1 (or call `enable()`) to
+record. While disabled `span` returns a shared no-op and `inc` returns
+immediately, so the hooks cost a function call and a flag check.
+
+    with span("content.lookup"):
+        ...
+    inc("result_cache_hits_total", model="content")
+    set_gauge("model_bytes", neighbors.nbytes, model="content")
+
+Metrics are exported as Prometheus text (`prometheus()`) or a JSON-ready
+dict (`snapshot()`). `profile()` samples the calling thread's stacks for
+the duration of one request.
+"""
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+ENV = "BOOKS_INSTRUMENTATION"
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005
+
+_enabled = os.environ.get(ENV, "") not in ("", "0")
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Gauges are set whether or not recording is enabled; they change rarely"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Add one duration to the histogram `name`"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0}
+        hist["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist["count"] += 1
+        hist["sum"] += seconds
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe("stage_seconds", time.perf_counter() - self.start, stage=self.name, **self.labels)
+        return False
+
+
+def span(name, **labels):
+    """Time a block as stage `name` (in the `stage_seconds` histogram)"""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of `span`"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def rss_bytes():
+    """Resident memory of this process, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def snapshot():
+    """All metrics as plain dicts, ready for json.dumps"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: dict(v, buckets=list(v["buckets"])) for k, v in _histograms.items()}
+    rss = rss_bytes()
+    if rss is not None:
+        gauges[_key("process_resident_memory_bytes", {})] = rss
+
+    def entries(metrics, value):
+        return [dict(name=name, labels=dict(labels), **value(v)) for (name, labels), v in metrics.items()]
+
+    return {
+        "enabled": _enabled,
+        "counters": entries(counters, lambda v: {"value": v}),
+        "gauges": entries(gauges, lambda v: {"value": v}),
+        "histograms": entries(
+            histograms,
+            lambda v: {"count": v["count"], "sum": v["sum"],
+                       "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], v["buckets"]))},
+        ),
+    }
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def prometheus():
+    """All metrics in the Prometheus text exposition format"""
+    snap = snapshot()
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append("# TYPE {} {}".format(name, kind))
+
+    for c in snap["counters"]:
+        header(c["name"], "counter")
+        lines.append("{}{} {}".format(c["name"], _labels(c["labels"]), c["value"]))
+    for g in snap["gauges"]:
+        header(g["name"], "gauge")
+        lines.append("{}{} {}".format(g["name"], _labels(g["labels"]), g["value"]))
+    for h in snap["histograms"]:
+        header(h["name"], "histogram")
+        cumulative = 0
+        for bound, count in h["buckets"].items():
+            cumulative += count
+            lines.append("{}_bucket{} {}".format(h["name"], _labels(h["labels"], [("le", bound)]), cumulative))
+        lines.append("{}_count{} {}".format(h["name"], _labels(h["labels"]), h["count"]))
+        lines.append("{}_sum{} {}".format(h["name"], _labels(h["labels"]), h["sum"]))
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds from a helper thread.
+
+    Stacks are counted in collapsed form ("module:function;...", root
+    first), which flamegraph tools read directly.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def top(self, n=10):
+        """The n most sampled stacks as (stack, samples) pairs"""
+        return self.stacks.most_common(n)
+
+    def collapsed(self):
+        return "".join("{} {}\n".format(stack, count) for stack, count in self.stacks.items())
+
+
+class profile:
+    """Context manager sampling the calling thread, e.g. for one request"""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.profiler = SamplingProfiler(interval=interval)
+
+    def __enter__(self):
+        return self.profiler.start()
+
+    def __exit__(self, *exc):
+        self.profiler.stop()
+        return False
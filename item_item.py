@@ -0,0 +1,91 @@
+"""Item-item collaborative model: "readers who liked this also liked".
+
+Two books are similar when the same readers rated them alike (cosine of
+their rating columns). Built offline from the ingested ratings:
+
+    $ python ratings.py ingest
+    $ python item_item.py build --workers 4
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+from neighbors import NEIGHBORS, NeighborIndex, build_neighbor_index
+from publish import publishing, resolve
+from ratings import ARTIFACT_DIR as RATINGS_DIR
+from ratings import load_ratings
+
+FORMAT_VERSION = 1
+ARTIFACT_DIR = "artifacts/item-item-v{}".format(FORMAT_VERSION)
+
+
+def fit_item_item(ratings, k=NEIGHBORS, workers=1):
+    """Build the top-k co-rating neighbors of every catalog row.
+
+    Books nobody rated together have no similarity, so neighbors with a
+    score of zero are dropped (padded with -1) rather than ranked.
+    """
+    items = normalize(ratings.csc.T.astype(np.float32), norm="l2", axis=1).tocsr()
+    neighbors = build_neighbor_index(items, k=k, workers=workers)
+    unrelated = ~(neighbors.scores > 0)
+    neighbors.ids[unrelated] = -1
+    neighbors.scores[unrelated] = np.nan
+    return neighbors
+
+
+def save_item_item(neighbors, version, path=ARTIFACT_DIR):
+    """Write the neighbor table to `path`, replacing any previous artifact atomically"""
+    with publishing(path) as out:
+        np.save(os.path.join(out, "neighbor_ids.npy"), neighbors.ids)
+        np.save(os.path.join(out, "neighbor_scores.npy"), neighbors.scores)
+        manifest = {"format": FORMAT_VERSION, "catalog_version": version, "k": neighbors.k}
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+
+def load_item_item(path=ARTIFACT_DIR, version=None):
+    """Open a saved neighbor table with memory-mapping.
+
+    Returns None if there is no artifact at `path`, or if `version` is given
+    and it was built against a different catalog.
+    """
+    path = resolve(path)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest["format"] != FORMAT_VERSION:
+        return None
+    if version is not None and manifest["catalog_version"] != version:
+        return None
+    return NeighborIndex(
+        np.load(os.path.join(path, "neighbor_ids.npy"), mmap_mode="r"),
+        np.load(os.path.join(path, "neighbor_scores.npy"), mmap_mode="r"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compute the neighbor table and save it")
+    build.add_argument("--ratings", default=RATINGS_DIR, help="output of `ratings.py ingest`")
+    build.add_argument("--out", default=ARTIFACT_DIR)
+    build.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.command == "build":
+        ratings = load_ratings(args.ratings)
+        if ratings is None:
+            parser.error("no ratings at {}, run `python ratings.py ingest` first".format(args.ratings))
+        neighbors = fit_item_item(ratings, workers=args.workers)
+        save_item_item(neighbors, ratings.version, args.out)
+        print("wrote {} ({} books)".format(args.out, len(neighbors)))
+
+
+if __name__ == "__main__":
+    main()
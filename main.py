@@ -1,16 +1,19 @@
-import numpy as np
 import streamlit as st
 import pandas as pd
-import sqlite3
 import hashlib
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from catalog import UI_COLUMNS, catalog_fingerprint, read_catalog
+from collab import load_collab
+from content_model import build_id as content_build_id
+from instrumentation import inc, is_enabled, profile, set_gauge, span, timed
+from item_item import load_item_item
+from popularity import popularity_ranking
+from recommenders import COLUMNS, content_neighbors, popular, similar, similar_popular
+from result_cache import ResultCache
+from title_search import SEARCH_RESULTS, book_row, title_index
+from user_store import user_store
 
 
-# collaborative filtering works perfectly on local
-# from surprise import Reader, Dataset, SVD
-# from surprise import Reader, Dataset, SVD
 def check_password():
     """Returns `True` if the user had a correct password."""
 
@@ -46,108 +49,156 @@ def check_password():
     return False
 
 # data loading
-@st.cache()
+# Heavy objects are built once per process and shared by every session.
+# They are cached by a cheap catalog fingerprint/version rather than by
+# hashing DataFrame arguments, and recommenders never mutate them. Only the
+# current version is kept, so a catalog update replaces the old copy.
 def read_book_data():
-    return pd.read_csv("data/books_cleaned.csv")
+    with span("catalog.fingerprint"):
+        fingerprint = catalog_fingerprint()
+    return _read_book_data(fingerprint)
+
+
+@st.cache_resource(max_entries=1)
+def _read_book_data(fingerprint):
+    inc("model_rebuilds_total", model="catalog")
+    with span("catalog.load"):
+        books = read_catalog(columns=UI_COLUMNS)
+    set_gauge("model_bytes", int(books.memory_usage(deep=True).sum()), model="catalog")
+    popularity_ranking(books)
+    with span("title_search.build"):
+        title_index(books)
+    return books
+
+
+def read_collab_model(version):
+    # trained offline by `python collab.py train`; None if it is missing or stale
+    model = _read_collab_model(version)
+    if model is None:
+        # don't remember the miss, so the model is picked up once it is trained
+        _read_collab_model.clear()
+    return model
+
+
+@st.cache_resource(max_entries=1)
+def _read_collab_model(version):
+    inc("model_rebuilds_total", model="collab")
+    model = load_collab(version=version)
+    if model is not None:
+        set_gauge("model_bytes", model.user_factors.nbytes + model.item_factors.nbytes, model="collab")
+    return model
+
+
+def read_item_item_model(version):
+    # built offline by `python item_item.py build`; None if it is missing or stale
+    neighbors = _read_item_item_model(version)
+    if neighbors is None:
+        _read_item_item_model.clear()
+    return neighbors
+
+
+@st.cache_resource(max_entries=1)
+def _read_item_item_model(version):
+    inc("model_rebuilds_total", model="item-item")
+    neighbors = load_item_item(version=version)
+    if neighbors is not None:
+        set_gauge("model_bytes", neighbors.nbytes, model="item-item")
+    return neighbors
 
 
-# @st.cache()
-# def read_ratings_data():
-#     return pd.read_csv('data/ratings.csv')
+def content(books):
+    version = books.attrs.get("catalog_version")
+    if version is None:
+        # ad-hoc frames have no identity to cache by
+        return content_neighbors(books)
+    return _content(version, content_build_id(), books)
 
 
-@st.cache()
-def content(books):
-    books["content"] = pd.Series(
-        books[["authors", "title", "genres", "description"]].fillna("").values.tolist()
-    ).str.join(" ")
+@st.cache_resource(max_entries=1)
+def _content(version, build_id, _books):
+    inc("model_rebuilds_total", model="content")
+    return content_neighbors(_books)
 
-    tf_content = TfidfVectorizer(
-        analyzer="word", ngram_range=(1, 2), min_df=0, stop_words="english"
-    )
-    tfidf_matrix = tf_content.fit_transform(books["content"])
-    cosine = linear_kernel(tfidf_matrix, tfidf_matrix)
-    index = pd.Series(books.index, index=books["title"])
 
-    return cosine, index
+# recommendations are deterministic for a given catalog, and traffic is
+# skewed towards a few popular titles
+results = ResultCache(ttl=3600)
 
 
+@timed("recommend.simple")
+@results.cached("simple")
 def simple_recommender(books, n=5):
-    v = books["ratings_count"]
-    m = books["ratings_count"].quantile(0.95)
-    R = books["average_rating"]
-    C = books["average_rating"].median()
-    score = (v / (v + m) * R) + (m / (m + v) * C)
-    books["score"] = score
-    qualified = books.sort_values("score", ascending=False)
-    return qualified[["book_id", "title", "authors", "score"]].head(n)
-
-
-def content_recommendation(books, title, n=5):
-    cosine_sim, indices = content(books)
-    idx = indices[title]
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1 : n + 1]
-    book_indices = [i[0] for i in sim_scores]
-    return books[
-        ["book_id", "title", "authors", "average_rating", "ratings_count"]
-    ].iloc[book_indices]
-
-
-def improved_recommendation(books, title, n=5):
-    cosine_sim, indices = content(books)
-    idx = indices[title]
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1:26]
-    book_indices = [i[0] for i in sim_scores]
-    books2 = books.iloc[book_indices][
-        ["book_id", "title", "authors", "average_rating", "ratings_count"]
-    ]
-
-    v = books2["ratings_count"]
-    m = books2["ratings_count"].quantile(0.75)  # here the minimum rating is quantile 75
-    R = books2["average_rating"]
-    C = books2["average_rating"].median()
-    books2["weighted_rating"] = (v / (v + m) * R) + (m / (m + v) * C)
-
-    high_rating = books2[books2["ratings_count"] >= m]
-    high_rating = high_rating.sort_values("weighted_rating", ascending=False)
-
-    return high_rating[
-        ["book_id", "title", "authors", "average_rating", "ratings_count"]
-    ].head(n)
-
-
-# def book_read(books, ratings_data, user_id):
-#     """Take user_id and return list of book that user has read"""
-#     books_list = list(books['book_id'])
-#     book_read_list = list(ratings_data['book_id'][ratings_data['user_id'] == user_id])
-#     return books_list, book_read_list
-
-
-# def get_recommendation_svd(books, ratings_data, user_id, n=5):
-#     """Give n recommendation to user_id"""
-#
-#     all_books, user_books = book_read(books, ratings_data, user_id)
-#     next_books = [book for book in all_books if book not in user_books]
-#
-#     reader = Reader(rating_scale=(1, 5))
-#     data = Dataset.load_from_df(ratings_data, reader)
-#     svd = SVD(random_state=0, n_epochs=30, lr_all=0.005, reg_all=0.04)
-#     svd.fit(data.build_full_trainset())
-#
-#     if n <= len(next_books):
-#         ratings = []
-#         for book in next_books:
-#             est = svd.predict(user_id, book).est
-#             ratings.append((book, est))
-#         ratings = sorted(ratings, key=lambda x: x[1], reverse=True)
-#         book_ids = [id_ for id_, rate in ratings[:n]]
-#         return books[books.book_id.isin(book_ids)][['book_id', 'title', 'authors', 'average_rating', 'ratings_count']]
-#     else:
-#         print('Please reduce your recommendation request')
+    return popular(books, n)
+
+
+@timed("recommend.content")
+@results.cached("content", build=content_build_id)
+def content_recommendation(books, book_id, n=5):
+    neighbors = content(books)
+    return similar(books, neighbors, book_id, n)
+
+
+@timed("recommend.content-plus")
+@results.cached("content-plus", build=content_build_id)
+def improved_recommendation(books, book_id, n=5):
+    neighbors = content(books)
+    return similar_popular(books, neighbors, book_id, n)
+
+
+@timed("recommend.item-item")
+def item_item_recommendation(books, book_id, n=5):
+    neighbors = read_item_item_model(books.attrs.get("catalog_version"))
+    idx = book_row(books, book_id)
+    book_indices, _ = neighbors.neighbors(idx, n)
+    return books[COLUMNS].iloc[book_indices]
+
+
+def book_read(model, user_id):
+    """Take user_id and return the catalog rows of the books that user has read"""
+    return model.book_read(user_id)
+
+
+@timed("recommend.collab")
+def get_recommendation_svd(books, model, user_id, n=5):
+    """Give n recommendation to user_id"""
+    rows, _ = model.recommend(user_id, n)
+    return books[COLUMNS].iloc[rows]
+
+
+def pick_book(books):
+    """Search box plus the best matching titles; returns a book_id or None"""
+    query = st.text_input("Search for your favorite book")
+    if query:
+        matches = title_index(books).search(query, fuzzy=True)
+        if len(matches) == 0:
+            st.write("No book matches your search")
+            return None
+    else:
+        rows, _ = popularity_ranking(books).top(SEARCH_RESULTS)
+        matches = books["book_id"].to_numpy()[rows]
+
+    # only the matches are sent to the browser, labelled with their authors
+    # to tell apart books with the same title
+    picked = books.iloc[[book_row(books, book_id) for book_id in matches]]
+    labels = dict(zip(picked["book_id"], picked["title"].astype(str) + " by " + picked["authors"].astype(str)))
+    return st.selectbox(
+        "Pick your favorite book",
+        list(matches),
+        index=None,
+        format_func=labels.get,
+        placeholder="Type above to search, or pick a popular book",
+    )
+
+
+def run_recommender(recommender, **kwargs):
+    """Call a recommender, showing its hottest stacks if profiling is on"""
+    if not st.session_state.get("profile_request"):
+        return recommender(**kwargs)
+    with profile() as profiler:
+        recs = recommender(**kwargs)
+    with st.expander("Profile"):
+        st.text("\n".join("{:>5} {}".format(count, stack) for stack, count in profiler.top(10)))
+    return recs
 
 
 # App declaration
@@ -159,7 +210,7 @@ def home():
     with st.expander("See explanation"):
         st.write(
             """
-            In this book recommender, there are three models available.
+            In this book recommender, there are five models available.
             1. Simple Recommender
             This model offers generalized recommendations to every user based on popularity and average rating of 
             the book. This model does not provide user-specific recommendations.
@@ -173,10 +224,20 @@ def home():
             The mechanism to remove books with low ratings has been added on top of the content based filtering.
             This model will return books that are similar to your input, are popular and have high ratings.
 
+            4. Collaborative Filtering
+            Enter your user ID and the model will predict your rating of every book you have not read yet, based 
+            on the ratings of readers with similar taste, and suggest the books with the highest predictions.
+
+            5. Readers Also Liked
+            Pick your favorite book and the model will suggest the books that readers who rated it rated most 
+            alike.
+
             """
         )
 
-    books = read_book_data().copy()
+    books = read_book_data()
+    if is_enabled():
+        st.sidebar.checkbox("Profile recommendations", key="profile_request")
 
     # User input
     model, book_num = st.columns((2, 1))
@@ -186,6 +247,8 @@ def home():
             "Simple Recommender",
             "Content Based Filtering",
             "Content Based Filtering+",
+            "Collaborative Filtering",
+            "Readers Also Liked",
         ],
     )
     selected_book_num = book_num.selectbox(
@@ -195,71 +258,72 @@ def home():
     if selected_model == "Simple Recommender":
         if st.button("Recommend"):
             try:
-                recs = simple_recommender(books=books, n=selected_book_num)
+                recs = run_recommender(simple_recommender, books=books, n=selected_book_num)
                 st.write(recs)
             except:
                 st.error("Oops!. I need to fix this algorithm.")
 
-    # elif selected_model == 'Collaborative Filtering':
-    #     ratings_data = read_ratings_data()
-    #     # user_id_picked = st.selectbox('Select user_id to explore', ratings_data["user_id"].unique(), 0)
-    #     user_id_picked = st.number_input(label="User ID:", min_value=1, max_value=60000)
-    #     if st.button('Recommend'):
-    #         if user_id_picked in ratings_data["user_id"].unique():
-    #             with st.spinner('Getting recommendation for you...'):
-    #                 recs = get_recommendation_svd(books=books,
-    #                                               ratings_data=ratings_data,
-    #                                               user_id=user_id_picked,
-    #                                               n=selected_book_num)
-    #             st.write(recs)
-    #         else:
-    #             st.write('You have entered an invalid User ID')
+    elif selected_model == "Collaborative Filtering":
+        collab_model = read_collab_model(books.attrs.get("catalog_version"))
+        if collab_model is None:
+            st.error("The collaborative model has not been trained yet.")
+            return
+        user_id_picked = st.number_input(label="User ID:", min_value=1, max_value=60000)
+        if st.button("Recommend"):
+            if collab_model.user_row(user_id_picked) is not None:
+                recs = run_recommender(
+                    get_recommendation_svd,
+                    books=books,
+                    model=collab_model,
+                    user_id=user_id_picked,
+                    n=selected_book_num,
+                )
+                st.write(recs)
+            else:
+                st.write("You have entered an invalid User ID")
 
     else:
-        options = np.concatenate(([""], books["title"].unique()))
-        book_title = st.selectbox("Pick your favorite book", options, 0)
+        book_id = pick_book(books)
 
         if selected_model == "Content Based Filtering":
             if st.button("Recommend"):
-                if book_title == "":
+                if book_id is None:
                     st.write("Please pick a book or use Rating-Popularity Model")
                     return
                 try:
-                    # recs = content_recommendation(books=books,
-                    #                               title=book_title,
-                    #                               n=selected_book_num)
-                    recs = books[
-                        [
-                            "book_id",
-                            "title",
-                            "authors",
-                            "average_rating",
-                            "ratings_count",
-                        ]
-                    ].iloc[[i for i in range(selected_book_num)]]
+                    recs = run_recommender(
+                        content_recommendation, books=books, book_id=book_id, n=selected_book_num
+                    )
                     st.write(recs)
                 except:
                     st.error("Oops! I need to fix this algorithm.")
 
         elif selected_model == "Content Based Filtering+":
-            if book_title == "":
+            if book_id is None:
                 st.write("Please pick a book or use Simple Recommender")
                 return
             if st.button("Recommend"):
                 try:
-                    recs = books[
-                        [
-                            "book_id",
-                            "title",
-                            "authors",
-                            "average_rating",
-                            "ratings_count",
-                        ]
-                    ].iloc[[i for i in range(selected_book_num)]]
+                    recs = run_recommender(
+                        improved_recommendation, books=books, book_id=book_id, n=selected_book_num
+                    )
                     st.write(recs)
                 except:
                     st.error("Oops! I need to fix this algorithm.")
 
+        elif selected_model == "Readers Also Liked":
+            if read_item_item_model(books.attrs.get("catalog_version")) is None:
+                st.error("The item-item model has not been built yet.")
+                return
+            if st.button("Recommend"):
+                if book_id is None:
+                    st.write("Please pick a book or use Simple Recommender")
+                    return
+                recs = run_recommender(
+                    item_item_recommendation, books=books, book_id=book_id, n=selected_book_num
+                )
+                st.write(recs)
+
 
 # Security
 # passlib,hashlib,bcrypt,scrypt
@@ -267,41 +331,19 @@ def make_hashes(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
 
-def check_hashes(password, hashed_text):
-    if make_hashes(password) == hashed_text:
-        return hashed_text
-    return False
-
-
-conn = sqlite3.connect("data.db")
-c = conn.cursor()
-
-
-# DB  Functions
-def create_usertable():
-    c.execute("CREATE TABLE IF NOT EXISTS userstable(username TEXT,password TEXT)")
-
-
-def add_userdata(username, password):
-    c.execute(
-        "INSERT INTO userstable(username,password) VALUES (?,?)", (username, password)
-    )
-    conn.commit()
-
-
 def login_user(username, password):
-    c.execute(
-        "SELECT * FROM userstable WHERE username =? AND password = ?",
-        (username, password),
-    )
-    data = c.fetchall()
-    return data
-
+    """True if the credentials are valid.
 
-def view_all_users():
-    c.execute("SELECT * FROM userstable")
-    data = c.fetchall()
-    return data
+    An authenticated session is remembered in `st.session_state`, so the
+    reruns of every later interaction don't query the database again.
+    """
+    credentials = (username, make_hashes(password))
+    if st.session_state.get("authenticated") == credentials:
+        return True
+    if user_store().login(*credentials):
+        st.session_state["authenticated"] = credentials
+        return True
+    return False
 
 
 def main():
@@ -327,12 +369,7 @@ def main():
         username = st.sidebar.text_input("User Name")
         password = st.sidebar.text_input("Password", type="password")
         if st.sidebar.checkbox("Login"):
-            # if password == '12345':
-            create_usertable()
-            hashed_pswd = make_hashes(password)
-
-            result = login_user(username, check_hashes(password, hashed_pswd))
-            if result:
+            if login_user(username, password):
 
                 st.success("Logged In as {}".format(username))
 
@@ -346,8 +383,9 @@ def main():
         new_password = st.text_input("Password", type="password")
 
         if st.button("Signup"):
-            create_usertable()
-            add_userdata(new_user, make_hashes(new_password))
+            if not user_store().add_user(new_user, make_hashes(new_password)):
+                st.warning("Username {} is already taken".format(new_user))
+                return
             st.success("You have successfully created a valid Account")
             st.info("Go to Login Menu to login")
 
@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+# improved_recommendation re-ranks the 25 closest books, so that is the
+# deepest any recommender reads into a neighbor list.
+NEIGHBORS = 25
+
+# number of float64 similarity values held in memory per block (~64 MB)
+BLOCK_BUDGET = 8_000_000
+
+
+class NeighborIndex:
+    """Top-K most similar rows for every row of an item matrix.
+
+    `ids[i]` holds the row numbers of the K nearest rows of row `i`, best
+    first, and `scores[i]` their similarities. Rows with fewer than K
+    neighbors are padded with -1 / nan.
+    """
+
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @property
+    def k(self):
+        return self.ids.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.scores.nbytes
+
+    def neighbors(self, row, n=None):
+        """Return (ids, scores) of the n nearest rows of `row`, best first"""
+        n = self.k if n is None else min(n, self.k)
+        ids = self.ids[row, :n]
+        keep = ids >= 0
+        return ids[keep], self.scores[row, :n][keep]
+
+    def batch(self, rows, n=None):
+        """Return the (len(rows), n) ids and scores of several rows at once.
+
+        Padding (-1 / nan) is kept so the result stays rectangular.
+        """
+        n = self.k if n is None else min(n, self.k)
+        rows = np.asarray(rows)
+        return self.ids[rows, :n], self.scores[rows, :n]
+
+
+def rows_per_block(n_cols, budget=BLOCK_BUDGET):
+    """Rows of an n_cols wide similarity block that fit in the memory budget"""
+    return max(1, min(n_cols, budget // max(n_cols, 1)))
+
+
+def top_n(scores, n, exclude=None):
+    """Select the n highest scores of every row of `scores`, best first.
+
+    `scores` is one row (N,) or a batch of rows (B, N); `exclude` optionally
+    gives, per row, one column to leave out (usually the query book itself).
+    Returns (ids, scores) as int32/float32 arrays of shape (B, n), padded
+    with -1 / nan when a row has fewer than n candidates. Ties are broken by
+    the lower column number, so the result equals a stable sort's.
+    """
+    scores = np.array(scores, dtype=np.float64, ndmin=2)
+    n_rows, n_cols = scores.shape
+    # nan ranks last, like -inf
+    scores[np.isnan(scores)] = -np.inf
+    if exclude is not None:
+        scores[np.arange(n_rows), exclude] = -np.inf
+    n_eff = min(n, n_cols - (exclude is not None))
+
+    ids = np.full((n_rows, n), -1, dtype=np.int32)
+    top = np.full((n_rows, n), np.nan, dtype=np.float32)
+    if n_eff <= 0:
+        return ids, top
+
+    cand = np.argpartition(-scores, n_eff - 1, axis=1)[:, :n_eff]
+    # argpartition picks arbitrarily among columns tied with the n_eff-th
+    # best score; in rows where that happens take the lowest numbered ones
+    kth = np.take_along_axis(scores, cand, axis=1).min(axis=1, keepdims=True)
+    ambiguous = np.flatnonzero((scores >= kth).sum(axis=1) > n_eff)
+    if len(ambiguous):
+        sub = scores[ambiguous]
+        tied = sub == kth[ambiguous]
+        if exclude is not None:
+            tied[np.arange(len(ambiguous)), np.broadcast_to(exclude, n_rows)[ambiguous]] = False
+        need = n_eff - (sub > kth[ambiguous]).sum(axis=1, keepdims=True)
+        chosen = (sub > kth[ambiguous]) | (tied & (np.cumsum(tied, axis=1) <= need))
+        cand[ambiguous] = np.nonzero(chosen)[1].reshape(len(ambiguous), n_eff)
+    cand = np.sort(cand, axis=1)
+    cand_scores = np.take_along_axis(scores, cand, axis=1)
+    order = np.argsort(-cand_scores, axis=1, kind="stable")
+
+    ids[:, :n_eff] = np.take_along_axis(cand, order, axis=1)
+    top[:, :n_eff] = np.take_along_axis(cand_scores, order, axis=1)
+    return ids, top
+
+
+# the matrix each pool worker computes blocks of, set once per process
+_worker_matrix = None
+
+
+def _init_worker(matrix):
+    global _worker_matrix
+    _worker_matrix = matrix
+
+
+def _block_top_k(matrix, matrix_t, start, stop, k):
+    sims = matrix[start:stop] @ matrix_t
+    if sp.issparse(sims):
+        sims = sims.toarray()
+    return top_n(sims, k, exclude=np.arange(start, stop))
+
+
+def _worker_block(start, stop, k):
+    matrix, matrix_t = _worker_matrix
+    return _block_top_k(matrix, matrix_t, start, stop, k)
+
+
+def build_neighbor_index(matrix, k=NEIGHBORS, block_size=None, workers=1):
+    """Build a NeighborIndex from the dot products of the rows of `matrix`.
+
+    For l2-normalized rows (TF-IDF output) the dot product is the cosine
+    similarity. Similarities are computed one block of rows at a time, so
+    only a block_size x N dense slice is ever held in memory (per worker)
+    and the result grows as O(N*K) instead of O(N^2). With workers > 1 the
+    blocks are spread over a process pool.
+    """
+    n_rows = matrix.shape[0]
+    if block_size is None:
+        block_size = rows_per_block(n_rows)
+    matrix_t = matrix.T.tocsc() if sp.issparse(matrix) else matrix.T
+    blocks = [
+        (start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)
+    ]
+
+    ids = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float32)
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=((matrix, matrix_t),)
+        ) as pool:
+            futures = [pool.submit(_worker_block, start, stop, k) for start, stop in blocks]
+            for (start, stop), future in zip(blocks, futures):
+                ids[start:stop], scores[start:stop] = future.result()
+    else:
+        for start, stop in blocks:
+            ids[start:stop], scores[start:stop] = _block_top_k(
+                matrix, matrix_t, start, stop, k
+            )
+    return NeighborIndex(ids, scores)
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+from instrumentation import inc
+
+# quantile of ratings_count a book needs to count as popular
+POPULAR_QUANTILE = 0.95
+
+_rankings = {}
+_lock = threading.Lock()
+
+
+class PopularityRanking:
+    """Catalog rows sorted by weighted rating.
+
+    `order` holds row positions, most popular first, and `scores` the
+    weighted rating of every row in catalog order.
+    """
+
+    def __init__(self, order, scores, version=None):
+        self.order = order
+        self.scores = scores
+        self.version = version
+
+    def top(self, n):
+        """Return (rows, scores) of the n most popular books"""
+        rows = self.order[:n]
+        return rows, self.scores[rows]
+
+
+def weighted_rating(books, quantile=POPULAR_QUANTILE):
+    """IMDB-style weighted rating, shrinking the average towards the median"""
+    v = books["ratings_count"].to_numpy(dtype=np.float64)
+    R = books["average_rating"].to_numpy(dtype=np.float64)
+    m = np.quantile(v, quantile)
+    C = np.median(R)
+    return (v / (v + m) * R) + (m / (m + v) * C)
+
+
+def build_ranking(books):
+    scores = weighted_rating(books)
+    order = np.argsort(-scores, kind="stable").astype(np.int32)
+    return PopularityRanking(order, scores, books.attrs.get("catalog_version"))
+
+
+def popularity_ranking(books):
+    """Return the ranking of `books`, computed once per catalog version.
+
+    Frames without a `catalog_version` attr (ad-hoc or test data) are ranked
+    on every call.
+    """
+    version = books.attrs.get("catalog_version")
+    if version is None:
+        return build_ranking(books)
+    ranking = _rankings.get(version)
+    if ranking is None:
+        with _lock:
+            ranking = _rankings.get(version)
+            if ranking is None:
+                inc("model_rebuilds_total", model="popularity")
+                ranking = build_ranking(books)
+                _rankings.clear()
+                _rankings[version] = ranking
+    return ranking
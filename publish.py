@@ -0,0 +1,55 @@
+"""Atomic replacement of on-disk artifacts.
+
+An artifact path such as `artifacts/content-v4` is a symlink to one build
+directory under `artifacts/content-v4.builds/`. A new build is written to
+a fresh directory and the link is switched to it with a single
+os.replace, so readers see the old build or the new one, never a gap.
+Readers `resolve` the link once and read every file from that build.
+
+    with publishing(path) as build:
+        np.save(os.path.join(build, "ids.npy"), ids)
+"""
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+# builds kept on disk: the current one, plus the one before it for readers
+# that resolved the link just before the switch
+KEEP = 2
+
+
+def resolve(path):
+    """The build directory `path` points to right now"""
+    return os.path.realpath(path)
+
+
+@contextmanager
+def publishing(path, keep=KEEP):
+    """Yield a new, empty build directory and publish it at `path` on success"""
+    builds = path + ".builds"
+    # names sort by creation time
+    name = "{:016x}-{}".format(time.time_ns(), uuid.uuid4().hex[:8])
+    build = os.path.join(builds, name)
+    os.makedirs(build)
+    try:
+        yield build
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+
+    link = "{}.{}.link".format(path, name)
+    os.symlink(os.path.join(os.path.basename(builds), name), link)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # a plain directory from before builds were versioned, replaced once
+        shutil.rmtree(path)
+    os.replace(link, path)
+    _prune(builds, name, keep)
+
+
+def _prune(builds, current, keep):
+    """Delete all but the `keep` newest builds"""
+    older = sorted((name for name in os.listdir(builds) if name != current), reverse=True)
+    for name in older[keep - 1 :]:
+        shutil.rmtree(os.path.join(builds, name), ignore_errors=True)
@@ -0,0 +1,198 @@
+"""User ratings as compact sparse matrices.
+
+`data/ratings.csv` is streamed in chunks into a users x books CSR matrix
+(and its CSC transpose) with int32 indices and uint8 ratings, and saved
+for the models to memory-map:
+
+    $ python ratings.py ingest
+"""
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from catalog import CATALOG_PATH, read_catalog
+from publish import publishing, resolve
+
+RATINGS_PATH = "data/ratings.csv"
+# bump whenever the on-disk layout changes
+FORMAT_VERSION = 2
+ARTIFACT_DIR = "artifacts/ratings-v{}".format(FORMAT_VERSION)
+CHUNKSIZE = 1_000_000
+
+DTYPES = {"user_id": np.int32, "book_id": np.int32, "rating": np.uint8}
+
+
+class RatingsMatrix:
+    """Users x books ratings.
+
+    Row `u` belongs to `user_ids[u]` and column `i` is catalog row `i`.
+    `csr` answers "what did this user rate", `csc` "who rated this book";
+    both are O(length of the answer). `ingest_id` is new for every ingest,
+    since the user rows can move even when the catalog stays the same.
+    """
+
+    def __init__(self, user_ids, csr, csc, version=None, ingest_id=None):
+        self.user_ids = user_ids
+        self.csr = csr
+        self.csc = csc
+        self.version = version
+        self.ingest_id = ingest_id
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+    def user_row(self, user_id):
+        """Return the matrix row of `user_id`, or None for an unknown user"""
+        row = np.searchsorted(self.user_ids, user_id)
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return int(row)
+        return None
+
+    def books_read(self, user_id):
+        """Return the catalog rows of the books `user_id` has rated"""
+        row = self.user_row(user_id)
+        if row is None:
+            return np.empty(0, dtype=np.int32)
+        return self.csr.indices[self.csr.indptr[row] : self.csr.indptr[row + 1]]
+
+    def readers(self, book_row):
+        """Return the matrix rows of the users who rated catalog row `book_row`"""
+        return self.csc.indices[self.csc.indptr[book_row] : self.csc.indptr[book_row + 1]]
+
+
+def _chunks(path, chunksize):
+    return pd.read_csv(
+        path, usecols=list(DTYPES), dtype=DTYPES, chunksize=chunksize
+    )
+
+
+def ingest_ratings(path, book_ids, chunksize=CHUNKSIZE, version=None):
+    """Stream ratings.csv into a RatingsMatrix over the catalog `book_ids`.
+
+    The file is read twice: once to collect the user ids and count the
+    ratings per user, once to write every chunk straight into its final
+    place in the CSR arrays. Apart from the result itself, memory is
+    bounded by the chunk size. Ratings of books outside the catalog are
+    dropped.
+    """
+    book_index = pd.Index(book_ids)
+
+    user_ids = np.empty(0, dtype=np.int32)
+    counts = np.empty(0, dtype=np.int64)
+    for chunk in _chunks(path, chunksize):
+        known = book_index.get_indexer(chunk["book_id"]) >= 0
+        ids, n = np.unique(chunk["user_id"].to_numpy()[known], return_counts=True)
+        user_ids, merged = np.unique(np.concatenate([user_ids, ids]), return_inverse=True)
+        counts = np.bincount(
+            merged, weights=np.concatenate([counts, n]), minlength=len(user_ids)
+        ).astype(np.int64)
+
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.empty(indptr[-1], dtype=np.uint8)
+
+    fill = indptr[:-1].copy()
+    for chunk in _chunks(path, chunksize):
+        cols = book_index.get_indexer(chunk["book_id"])
+        known = cols >= 0
+        rows = np.searchsorted(user_ids, chunk["user_id"].to_numpy()[known])
+        order = np.argsort(rows, kind="stable")
+        rows = rows[order]
+        # position of every rating within its user's run in this chunk
+        starts = np.searchsorted(rows, rows)
+        pos = fill[rows] + np.arange(len(rows)) - starts
+        indices[pos] = cols[known][order]
+        data[pos] = chunk["rating"].to_numpy()[known][order]
+        fill += np.bincount(rows, minlength=len(user_ids))
+
+    csr = sp.csr_matrix(
+        (data, indices, indptr), shape=(len(user_ids), len(book_index)), copy=False
+    )
+    csr.sort_indices()
+    return RatingsMatrix(user_ids.astype(np.int32), csr, csr.tocsc(), version, uuid.uuid4().hex)
+
+
+def save_ratings(ratings, path=ARTIFACT_DIR):
+    """Write `ratings` to `path`, replacing any previous artifact atomically"""
+    with publishing(path) as out:
+        np.save(os.path.join(out, "user_ids.npy"), ratings.user_ids)
+        # indptr and indices are saved with the (shared) dtype scipy chose for
+        # them, otherwise scipy casts and copies the memory-mapped arrays on load
+        for name, matrix in (("csr", ratings.csr), ("csc", ratings.csc)):
+            np.save(os.path.join(out, name + "_indptr.npy"), matrix.indptr)
+            np.save(os.path.join(out, name + "_indices.npy"), matrix.indices)
+            np.save(os.path.join(out, name + "_data.npy"), matrix.data.astype(np.uint8))
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "catalog_version": ratings.version,
+            "shape": list(ratings.shape),
+            "ingest_id": ratings.ingest_id,
+        }
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+
+def load_ratings(path=ARTIFACT_DIR, version=None):
+    """Open saved ratings with memory-mapping.
+
+    Returns None if there is no artifact at `path`, or if `version` is given
+    and the ratings were ingested against a different catalog.
+    """
+    path = resolve(path)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest["format"] != FORMAT_VERSION:
+        return None
+    if version is not None and manifest["catalog_version"] != version:
+        return None
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    shape = tuple(manifest["shape"])
+    csr = sp.csr_matrix(
+        (load("csr_data"), load("csr_indices"), load("csr_indptr")), shape=shape, copy=False
+    )
+    csc = sp.csc_matrix(
+        (load("csc_data"), load("csc_indices"), load("csc_indptr")), shape=shape, copy=False
+    )
+    return RatingsMatrix(
+        load("user_ids"), csr, csc, manifest["catalog_version"], manifest["ingest_id"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="convert ratings.csv to sparse matrices")
+    ingest.add_argument("--catalog", default=CATALOG_PATH)
+    ingest.add_argument("--ratings", default=RATINGS_PATH)
+    ingest.add_argument("--out", default=ARTIFACT_DIR)
+    ingest.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        books = read_catalog(args.catalog, columns=["book_id"])
+        ratings = ingest_ratings(
+            args.ratings, books["book_id"], args.chunksize, books.attrs["catalog_version"]
+        )
+        save_ratings(ratings, args.out)
+        print("wrote {} ({} users, {} books, {} ratings)".format(
+            args.out, *ratings.shape, ratings.csr.nnz
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Recommenders shared by the Streamlit app and the HTTP service.
+
+They take the catalog and already loaded models as arguments and never
+mutate them; caching and model lifetime are up to the caller. Books are
+picked by `book_id`, since titles are not unique.
+"""
+from catalog import TEXT_COLUMNS, read_catalog
+from content_model import fit_content, load_content
+from instrumentation import set_gauge, span
+from neighbors import NEIGHBORS
+from popularity import popularity_ranking
+from title_search import book_row
+
+COLUMNS = ["book_id", "title", "authors", "average_rating", "ratings_count"]
+
+
+def content_neighbors(books):
+    """Return the neighbor table of the content model for `books`"""
+    # the model is normally built offline (`python content_model.py build`);
+    # fitting it here is only the fallback for a missing or stale artifact
+    version = books.attrs.get("catalog_version")
+    with span("content.load"):
+        model = load_content(version=version) if version else None
+    if model is None:
+        with span("content.fit"):
+            if not set(TEXT_COLUMNS).issubset(books.columns):
+                books = read_catalog()
+            model = fit_content(books)
+    set_gauge("model_bytes", model.neighbors.nbytes, model="content")
+    return model.neighbors
+
+
+def popular(books, n=5):
+    with span("popularity.top"):
+        rows, score = popularity_ranking(books).top(n)
+    qualified = books[["book_id", "title", "authors"]].iloc[rows]
+    return qualified.assign(score=score)
+
+
+def similar(books, neighbors, book_id, n=5):
+    with span("content.lookup"):
+        idx = book_row(books, book_id)
+        book_indices, _ = neighbors.neighbors(idx, n)
+    return books[COLUMNS].iloc[book_indices]
+
+
+def similar_popular(books, neighbors, book_id, n=5):
+    with span("content.lookup"):
+        idx = book_row(books, book_id)
+        book_indices, _ = neighbors.neighbors(idx, NEIGHBORS)
+    with span("content_plus.rerank"):
+        books2 = books.iloc[book_indices][COLUMNS]
+
+        v = books2["ratings_count"]
+        m = books2["ratings_count"].quantile(0.75)  # here the minimum rating is quantile 75
+        R = books2["average_rating"]
+        C = books2["average_rating"].median()
+        books2["weighted_rating"] = (v / (v + m) * R) + (m / (m + v) * C)
+
+        high_rating = books2[books2["ratings_count"] >= m]
+        high_rating = high_rating.sort_values("weighted_rating", ascending=False)
+
+    return high_rating[COLUMNS].head(n)
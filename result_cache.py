@@ -0,0 +1,111 @@
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import inc
+
+MAXSIZE = 1024
+
+
+class ResultCache:
+    """Bounded, thread-safe LRU cache of recommendation results.
+
+    Entries are keyed by (model, query, catalog version) and remember the
+    largest n computed so far: recommenders return a best-first list, so
+    the answer for a smaller n is a prefix of it. A new catalog version
+    (i.e. rebuilt data and models) never matches an old key, and stale
+    entries simply age out. `ttl` (seconds) optionally expires entries.
+    """
+
+    def __init__(self, maxsize=MAXSIZE, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model, query, n, version):
+        """Return the cached top-n result, or None"""
+        key = (model, query, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[2] <= self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None or entry[0] < n:
+                self.misses += 1
+                inc("result_cache_misses_total", model=model)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            inc("result_cache_hits_total", model=model)
+            return entry[1].head(n)
+
+    def put(self, model, query, n, version, result):
+        key = (model, query, version)
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= n:
+                self._entries[key] = (n, result, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                inc("result_cache_evictions_total", model=evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def cached(self, model, build=None):
+        """Decorate a `recommender(books, [book_id | title,] n=5)` function.
+
+        The catalog version comes from `books.attrs`; frames without one
+        (ad-hoc or test data) bypass the cache. `build` optionally returns
+        the build id of the model artifact the recommender reads, which then
+        becomes part of the version, so rebuilding the artifact for the same
+        catalog invalidates its results too.
+        """
+
+        def decorator(fn):
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                books = bound.arguments["books"]
+                query = bound.arguments.get("book_id", bound.arguments.get("title"))
+                n = bound.arguments["n"]
+                version = books.attrs.get("catalog_version")
+                if version is None:
+                    return fn(*args, **kwargs)
+                if build is not None:
+                    version = (version, build())
+
+                result = self.get(model, query, n, version)
+                if result is None:
+                    result = fn(*args, **kwargs)
+                    self.put(model, query, n, version, result)
+                return result
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,274 @@
+"""JSON recommendation service for other backends.
+
+A small asyncio HTTP/1.1 server next to the Streamlit UI. The catalog and
+content model are loaded once in the background after the port opens;
+`/ready` answers 503 until that finishes, so health checks reflect real
+readiness. Scoring runs on a thread pool, never on the event loop.
+`/metrics` exports the instrumentation metrics (see instrumentation.py),
+and `profile=1` on a recommendation returns the stacks it spent time in.
+
+    $ python service.py --port 8000
+    $ curl 'localhost:8000/search?q=dune'
+    $ curl 'localhost:8000/recommend/content-plus?book_id=234225&n=5'
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from catalog import UI_COLUMNS, read_catalog
+from instrumentation import inc, profile, prometheus, set_gauge, snapshot, span
+from popularity import popularity_ranking
+from recommenders import content_neighbors, popular, similar, similar_popular
+from result_cache import ResultCache
+from title_search import SEARCH_RESULTS, title_index
+
+HOST = "0.0.0.0"
+PORT = 8000
+WORKERS = 4
+MAX_N = 100
+MAX_REQUEST = 64 * 1024
+
+log = logging.getLogger("service")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def records(frame):
+    """`frame` as a list of JSON-ready dicts.
+
+    float32 columns (the compact catalog's ratings) go through their
+    shortest repr, so 4.03 is sent as 4.03 and not 4.0300002098.
+    """
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == np.float32]:
+        frame[column] = frame[column].to_numpy().astype(str).astype(np.float64)
+    return json.loads(frame.to_json(orient="records"))
+
+
+class Recommender:
+    """The catalog and models one service process answers from"""
+
+    def __init__(self):
+        self.books = None
+        self.neighbors = None
+        self.titles = None
+        self.error = None
+        self.results = ResultCache(ttl=3600)
+
+    @property
+    def ready(self):
+        return self.titles is not None
+
+    def load(self):
+        inc("model_rebuilds_total", model="catalog")
+        with span("catalog.load"):
+            books = read_catalog(columns=UI_COLUMNS)
+        set_gauge("model_bytes", int(books.memory_usage(deep=True).sum()), model="catalog")
+        popularity_ranking(books)
+        self.neighbors = content_neighbors(books)
+        self.books = books
+        with span("title_search.build"):
+            self.titles = title_index(books)
+        log.info("loaded %d books (catalog %s)", len(books), books.attrs["catalog_version"])
+
+    def recommend(self, model, book_id, n):
+        """Return the top-n recommendations as a list of dicts"""
+        version = self.books.attrs.get("catalog_version")
+        with span("recommend." + model):
+            result = self.results.get(model, book_id, n, version)
+            if result is None:
+                if model == "popular":
+                    result = popular(self.books, n)
+                else:
+                    score = similar if model == "content" else similar_popular
+                    try:
+                        result = score(self.books, self.neighbors, book_id, n)
+                    except KeyError:
+                        raise HTTPError(HTTPStatus.NOT_FOUND, "unknown book_id: {}".format(book_id))
+                self.results.put(model, book_id, n, version, result)
+        return records(result)
+
+    def recommend_profiled(self, model, book_id, n):
+        """`recommend`, plus the stacks sampled while it ran"""
+        with profile() as profiler:
+            recs = self.recommend(model, book_id, n)
+        return recs, [{"stack": stack, "samples": count} for stack, count in profiler.top(20)]
+
+    def search(self, query, n, fuzzy):
+        """Best matching books for a title query, as a list of dicts"""
+        with span("title_search.search"):
+            rows = self.titles.search_rows(query, n, fuzzy)
+        matches = self.books[["book_id", "title", "authors"]].iloc[rows]
+        return records(matches)
+
+
+class Service:
+    def __init__(self, recommender=None, workers=WORKERS):
+        self.recommender = recommender or Recommender()
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="score")
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.pool, self.recommender.load)
+        except Exception as e:
+            self.recommender.error = repr(e)
+            log.exception("loading the models failed")
+
+    async def route(self, method, target):
+        """Return (status, payload) for one request"""
+        if method != "GET":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if url.path == "/metrics":
+            if query.get("format") == "json":
+                return HTTPStatus.OK, snapshot()
+            return HTTPStatus.OK, prometheus()
+        if url.path == "/ready":
+            if self.recommender.ready:
+                return HTTPStatus.OK, {"status": "ready"}
+            status = "failed" if self.recommender.error else "loading"
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"status": status, "error": self.recommender.error}
+
+        model = url.path[len("/recommend/"):] if url.path.startswith("/recommend/") else None
+        if url.path != "/search" and model not in ("popular", "content", "content-plus"):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        if not self.recommender.ready:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "models are still loading")
+        loop = asyncio.get_running_loop()
+
+        if url.path == "/search":
+            n = self.integer(query, "n", SEARCH_RESULTS)
+            matches = await loop.run_in_executor(
+                self.pool, self.recommender.search, query.get("q", ""), n, query.get("fuzzy") == "1"
+            )
+            return HTTPStatus.OK, {"query": query.get("q", ""), "matches": matches}
+
+        n = self.integer(query, "n", 5)
+        book_id = None
+        if model != "popular":
+            if "book_id" not in query:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "book_id is required")
+            book_id = self.integer(query, "book_id", None, maximum=None)
+
+        if query.get("profile") == "1":
+            recs, stacks = await loop.run_in_executor(
+                self.pool, self.recommender.recommend_profiled, model, book_id, n
+            )
+            return HTTPStatus.OK, {"model": model, "book_id": book_id, "recommendations": recs,
+                                   "profile": stacks}
+        recs = await loop.run_in_executor(self.pool, self.recommender.recommend, model, book_id, n)
+        return HTTPStatus.OK, {"model": model, "book_id": book_id, "recommendations": recs}
+
+    @staticmethod
+    def integer(query, name, default, maximum=MAX_N):
+        try:
+            value = int(query.get(name, default))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "{} must be an integer".format(name))
+        if maximum is not None and not 1 <= value <= maximum:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "{} must be between 1 and {}".format(name, maximum))
+        return value
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one (keep-alive) connection"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = lines[0].split(" ")
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": "bad request"}, False)
+                    break
+                if length:
+                    await reader.readexactly(min(length, MAX_REQUEST))
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await self.route(method, target)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception:
+                    log.exception("%s %s failed", method, target)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        """Send `payload` as JSON, or as plain text if it is a string"""
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        head = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: {}\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: {}\r\n\r\n"
+        ).format(status.value, status.phrase, content_type, len(body),
+                 "keep-alive" if keep_alive else "close")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host=HOST, port=PORT):
+        """Serve until cancelled, or return if the models fail to load"""
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST)
+        log.info("listening on %s:%d", host, port)
+        # models load in the background; /ready flips once they are in memory
+        loading = asyncio.create_task(self.load())
+        async with server:
+            serving = asyncio.create_task(server.serve_forever())
+            await loading
+            if self.recommender.error is not None:
+                # this process can never become ready; leave it to the
+                # supervisor (`restart: always`) to start a fresh one
+                serving.cancel()
+                return
+            await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    service = Service(workers=args.workers)
+    asyncio.run(service.serve(args.host, args.port))
+    if service.recommender.error is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
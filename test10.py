@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+from ann import build_ann_neighbor_index, build_ivf, embed, recall_at_k
+from content_model import fit_content
+from neighbors import build_neighbor_index
+
+
+class TestANN(unittest.TestCase):
+    def setUp(self):
+        # 300 documents drawn from 10 topics of 20 terms each
+        rng = np.random.default_rng(0)
+        dense = np.zeros((300, 200))
+        for row in range(300):
+            topic = row % 10
+            dense[row, rng.choice(np.arange(topic * 20, topic * 20 + 20), 8)] += 1
+        self.matrix = sp.csr_matrix(normalize(dense), dtype=np.float32)
+        self.exact = build_neighbor_index(self.matrix, k=5)
+
+    def test_embeddings(self):
+        embeddings = embed(self.matrix, dims=16)
+        self.assertEqual(embeddings.shape, (300, 16))
+        self.assertEqual(embeddings.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-5)
+
+    def test_probing_every_list_is_exact(self):
+        approx = build_ann_neighbor_index(self.matrix, k=5, n_probe=10, dims=16, n_lists=10)
+        # ids may differ between books with (numerically) tied scores
+        np.testing.assert_allclose(approx.scores, self.exact.scores, rtol=1e-5)
+        self.assertGreater(recall_at_k(approx.ids, self.exact.ids), 0.8)
+
+    def test_batch_search_matches_single_queries(self):
+        index = build_ivf(embed(self.matrix, dims=16), n_lists=30)
+        ids, scores = index.search_batch(np.arange(300), 5, 3)
+        for row in (0, 17, 299):
+            np.testing.assert_array_equal(index.search(row, 5, 3)[0], ids[row])
+
+    def test_recall_grows_with_n_probe(self):
+        index = build_ivf(embed(self.matrix, dims=16), n_lists=30, matrix=self.matrix)
+        recalls = []
+        for n_probe in (1, 30):
+            ids = np.array([index.search(row, 5, n_probe)[0] for row in range(300)])
+            self.assertFalse(np.any(ids == np.arange(300)[:, None]))
+            recalls.append(recall_at_k(ids, self.exact.ids))
+        self.assertLessEqual(recalls[0], recalls[1])
+
+    def test_content_backend(self):
+        books = pd.DataFrame({
+            'title': ['Book{}'.format(i) for i in range(40)],
+            'authors': ['Author{}'.format(i % 4) for i in range(40)],
+            'genres': ['fantasy', 'crime', 'romance', 'history'] * 10,
+            'description': ['story number {}'.format(i) for i in range(40)],
+        })
+        model = fit_content(books, k=5, backend='ann')
+        self.assertEqual(model.backend, 'ann')
+        self.assertEqual(model.neighbors.ids.shape, (40, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from content_model import (build, changed_rows, fit_content, fitted_vectorizer, load_content,
+                           refresh_idf, update_content)
+from neighbors import build_neighbor_index
+
+WORDS = ['wizard', 'magic', 'school', 'dragon', 'crime', 'detective', 'murder', 'city',
+         'love', 'summer', 'wedding', 'letters', 'war', 'soldier', 'empire', 'history']
+
+
+def make_books(n, seed=0):
+    rng = np.random.default_rng(seed)
+    books = pd.DataFrame({
+        'book_id': np.arange(1, n + 1),
+        'title': ['Book{}'.format(i) for i in range(n)],
+        'authors': ['Author{}'.format(i % 7) for i in range(n)],
+        'genres': [' '.join(rng.choice(WORDS, 2)) for _ in range(n)],
+        'description': [' '.join(rng.choice(WORDS, 12)) for _ in range(n)],
+    })
+    books.attrs['catalog_version'] = 'v0'
+    return books
+
+
+class TestIncrementalUpdate(unittest.TestCase):
+    def setUp(self):
+        self.books = make_books(60)
+        self.model = fit_content(self.books, k=5)
+        self.updated = pd.concat([self.books, make_books(63, seed=1).iloc[60:]], ignore_index=True)
+        self.updated.loc[[3, 17], 'description'] = ['dragon empire war soldier', 'love letters summer']
+        self.updated.attrs['catalog_version'] = 'v1'
+
+    def test_changed_rows(self):
+        rows = changed_rows(self.model, self.updated)
+        self.assertEqual(list(rows), [3, 17, 60, 61, 62])
+        self.assertIsNone(changed_rows(self.model, self.books.iloc[:50]))
+
+    def test_update_matches_full_neighbor_build(self):
+        rows = changed_rows(self.model, self.updated)
+        model = update_content(self.model, self.updated, rows)
+
+        vectors = fitted_vectorizer(self.model).transform(self.updated['description'].iloc[[17]])
+        self.assertGreater((model.matrix[17] @ vectors.T).toarray()[0, 0], 0)
+        expected = build_neighbor_index(model.matrix, k=5)
+        np.testing.assert_allclose(model.neighbors.scores, expected.scores, rtol=1e-5)
+        self.assertEqual(model.index['Book61'], 61)
+        self.assertEqual(model.version, 'v1')
+        self.assertEqual(list(changed_rows(model, self.updated)), [])
+
+    def test_vocabulary_drift_triggers_refit(self):
+        self.updated.loc[60:, 'description'] = 'zeppelin quasar nebula galaxy'
+        rows = changed_rows(self.model, self.updated)
+        self.assertIsNone(update_content(self.model, self.updated, rows, drift_threshold=0.2))
+
+    def test_refresh_idf_without_changes_is_a_no_op(self):
+        refreshed = refresh_idf(self.model)
+        np.testing.assert_allclose(refreshed.idf, self.model.idf, rtol=1e-6)
+        np.testing.assert_allclose(refreshed.matrix.toarray(), self.model.matrix.toarray(), atol=1e-6)
+
+    def test_build_patches_saved_model(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = os.path.join(tmp, 'books.csv')
+            path = os.path.join(tmp, 'content')
+            self.books.to_csv(csv, index=False)
+            build(csv, path)
+            self.updated.to_csv(csv, index=False)
+            build(csv, path)
+            model = load_content(path)
+            self.assertEqual(len(model.neighbors), 63)
+            self.assertGreater(model.drift[1], 0)
+
+    def test_build_keeps_saved_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = os.path.join(tmp, 'books.csv')
+            path = os.path.join(tmp, 'content')
+            self.books.to_csv(csv, index=False)
+            build(csv, path, backend='ann', n_probe=3)
+            self.updated.to_csv(csv, index=False)
+            build(csv, path)
+            model = load_content(path)
+            self.assertEqual((model.backend, model.n_probe), ('ann', 3))
+            self.assertEqual(len(model.neighbors), 63)
+
+
+if __name__ == '__main__':
+    unittest.main()
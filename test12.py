@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+import batch
+from collab import train
+from main import content_recommendation, improved_recommendation
+from neighbors import build_neighbor_index
+from ratings import ingest_ratings
+from unittest.mock import patch
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 40
+        self.books = pd.DataFrame({
+            'book_id': np.arange(100, 100 + n),
+            'title': ['Book{}'.format(i) for i in range(n)],
+            'authors': ['Author{}'.format(i) for i in range(n)],
+            'average_rating': rng.uniform(2, 5, n).round(2),
+            'ratings_count': rng.integers(10, 10000, n),
+        })
+        vectors = rng.random((n, 6))
+        self.neighbors = build_neighbor_index(vectors @ vectors.T, k=25)
+
+    def test_content_matches_single_title(self):
+        rows = np.arange(len(self.books))
+        with patch('main.content', return_value=self.neighbors):
+            plain = batch.content_batch(self.neighbors, rows, 5)
+            plus = batch.content_plus_batch(
+                self.neighbors, rows, 5,
+                self.books['ratings_count'].to_numpy(np.float64),
+                self.books['average_rating'].to_numpy(np.float64),
+            )
+            for row, book_id in enumerate(self.books['book_id']):
+                expected = content_recommendation(self.books, book_id, 5).index
+                self.assertEqual(list(plain[row]), list(expected))
+                expected = improved_recommendation(self.books, book_id, 5).index
+                got = plus[row][plus[row] >= 0]
+                self.assertEqual(list(got), list(expected))
+
+    def test_collab_matches_single_user(self):
+        rng = np.random.default_rng(1)
+        ratings = pd.DataFrame(
+            [(u, b, rng.integers(1, 6)) for u in range(1, 21) for b in rng.choice(12, 5, replace=False)],
+            columns=['user_id', 'book_id', 'rating'],
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = os.path.join(tmp, 'ratings.csv')
+            ratings.to_csv(csv, index=False)
+            model = train(ingest_ratings(csv, np.arange(12), version='v1'), factors=3)
+        rows = np.array([model.user_row(u) for u in range(1, 21)])
+        recs = batch.collab_batch(model, rows, 4)
+        for user_id, rec in zip(range(1, 21), recs):
+            np.testing.assert_array_equal(rec, model.recommend(user_id, 4)[0])
+
+    def test_run_streams_in_order(self):
+        batch._state.update(
+            book_ids=self.books['book_id'].to_numpy(),
+            model=type('Model', (), {'neighbors': self.neighbors}),
+        )
+        out = io.StringIO()
+        writer = batch.JSONLWriter('-', 'book_id')
+        writer.file = out
+        with patch('batch._load'):
+            done = batch.run('content', np.arange(len(self.books)), 3, writer, chunk=7, progress=None)
+        self.assertEqual(done, len(self.books))
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['book_id'] for r in records], list(self.books['book_id']))
+        first = self.books['book_id'].iloc[self.neighbors.neighbors(0, 3)[0]]
+        self.assertEqual(records[0]['recommendations'], list(first))
+
+
+if __name__ == '__main__':
+    unittest.main()
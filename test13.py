@@ -0,0 +1,114 @@
+import asyncio
+import json
+import unittest
+import numpy as np
+import pandas as pd
+
+from neighbors import build_neighbor_index
+from service import Recommender, Service
+from title_search import build_title_index
+
+
+class FakeRecommender(Recommender):
+    def load(self):
+        self.books = pd.DataFrame({
+            'book_id': [1, 2, 3, 4],
+            'title': ['Book1', 'Book2', 'Book3', 'Book4'],
+            'authors': ['Author1', 'Author2', 'Author3', 'Author4'],
+            'average_rating': np.array([4.5, 3.1, 4.0, 5.0], dtype=np.float32),
+            'ratings_count': [100, 20, 300, 50],
+        })
+        self.books.attrs['catalog_version'] = 'service-v1'
+        vectors = np.array([[1, 0], [0.9, 0.1], [0.1, 0.9], [0.8, 0.2]])
+        self.neighbors = build_neighbor_index(vectors @ vectors.T)
+        self.titles = build_title_index(self.books)
+
+
+class FailingRecommender(Recommender):
+    def load(self):
+        raise FileNotFoundError('data/catalog/title.blob.npy')
+
+
+class TestService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = Service(FakeRecommender(), workers=2)
+        self.server = await asyncio.start_server(self.service.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.service.pool.shutdown()
+
+    async def get(self, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write('GET {} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n'.format(path).encode())
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def test_ready_after_load(self):
+        status, body = await self.get('/ready')
+        self.assertEqual((status, body['status']), (503, 'loading'))
+        status, _ = await self.get('/recommend/popular')
+        self.assertEqual(status, 503)
+
+        await self.service.load()
+        status, body = await self.get('/ready')
+        self.assertEqual((status, body['status']), (200, 'ready'))
+
+    async def test_serve_returns_when_loading_fails(self):
+        service = Service(FailingRecommender(), workers=1)
+        await asyncio.wait_for(service.serve('127.0.0.1', 0), timeout=5)
+        self.assertIn('FileNotFoundError', service.recommender.error)
+        service.pool.shutdown()
+
+    async def test_recommendations(self):
+        await self.service.load()
+        status, body = await self.get('/recommend/content?book_id=1&n=2')
+        self.assertEqual(status, 200)
+        self.assertEqual([r['title'] for r in body['recommendations']], ['Book2', 'Book4'])
+        self.assertEqual(body['recommendations'][0]['average_rating'], 3.1)
+
+        status, body = await self.get('/recommend/popular?n=3')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['recommendations']), 3)
+
+        status, body = await self.get('/recommend/content-plus?book_id=99')
+        self.assertEqual(status, 404)
+        status, body = await self.get('/recommend/content?n=2')
+        self.assertEqual(status, 400)
+        status, body = await self.get('/recommend/other')
+        self.assertEqual(status, 404)
+
+        status, body = await self.get('/search?q=book&n=2')
+        self.assertEqual(status, 200)
+        self.assertEqual([m['book_id'] for m in body['matches']], [3, 1])
+
+    async def test_metrics_and_profile(self):
+        await self.service.load()
+        status, body = await self.get('/recommend/content?book_id=1&n=2&profile=1')
+        self.assertEqual(status, 200)
+        self.assertIsInstance(body['profile'], list)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n')
+        response = (await reader.read()).decode()
+        writer.close()
+        self.assertIn('Content-Type: text/plain', response)
+        self.assertIn('process_resident_memory_bytes', response)
+
+    async def test_keep_alive(self):
+        await self.service.load()
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        for _ in range(2):
+            writer.write(b'GET /health HTTP/1.1\r\nHost: test\r\n\r\n')
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            self.assertEqual(json.loads(await reader.readexactly(length)), {'status': 'ok'})
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import time
+import unittest
+import pandas as pd
+
+import instrumentation
+from instrumentation import inc, profile, prometheus, set_gauge, snapshot, span, timed
+from result_cache import ResultCache
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.was_enabled = instrumentation.is_enabled()
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.enable(self.was_enabled)
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        instrumentation.enable(False)
+        with span('content.lookup'):
+            pass
+        inc('result_cache_hits_total', model='content')
+        snap = snapshot()
+        self.assertEqual(snap['counters'], [])
+        self.assertEqual(snap['histograms'], [])
+
+    def test_spans_and_counters(self):
+        instrumentation.enable()
+
+        @timed('recommend.content')
+        def recommend():
+            with span('content.lookup'):
+                return 1
+
+        for _ in range(3):
+            recommend()
+        inc('model_rebuilds_total', model='content')
+        set_gauge('model_bytes', 1024, model='content')
+
+        snap = snapshot()
+        stages = {h['labels']['stage']: h for h in snap['histograms']}
+        self.assertEqual(stages['recommend.content']['count'], 3)
+        self.assertEqual(sum(stages['content.lookup']['buckets'].values()), 3)
+        self.assertEqual(snap['counters'], [
+            {'name': 'model_rebuilds_total', 'labels': {'model': 'content'}, 'value': 1}
+        ])
+
+        text = prometheus()
+        self.assertIn('# TYPE stage_seconds histogram', text)
+        self.assertIn('stage_seconds_count{stage="recommend.content"} 3', text)
+        self.assertIn('stage_seconds_bucket{stage="content.lookup",le="+Inf"} 3', text)
+        self.assertIn('model_bytes{model="content"} 1024', text)
+
+    def test_result_cache_counters(self):
+        instrumentation.enable()
+        books = pd.DataFrame({'title': ['Book1', 'Book2']})
+        books.attrs['catalog_version'] = 'v1'
+        cache = ResultCache(maxsize=1)
+
+        @cache.cached('content')
+        def recommend(books, title, n=5):
+            return books.head(n)
+
+        recommend(books, 'Book1')
+        recommend(books, 'Book1')
+        recommend(books, 'Book2')
+        counters = {c['name']: c['value'] for c in snapshot()['counters']}
+        self.assertEqual(counters, {
+            'result_cache_misses_total': 2,
+            'result_cache_hits_total': 1,
+            'result_cache_evictions_total': 1,
+        })
+
+    def test_profile_samples_calling_thread(self):
+        with profile(interval=0.001) as profiler:
+            busy_wait(0.05)
+        stacks = profiler.top(1)
+        self.assertTrue(stacks)
+        self.assertIn('test14.py:busy_wait', stacks[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
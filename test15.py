@@ -0,0 +1,60 @@
+import unittest
+import pandas as pd
+
+from title_search import build_title_index, normalize, title_index
+
+
+class TestTitleSearch(unittest.TestCase):
+    def setUp(self):
+        self.books = pd.DataFrame({
+            'book_id': [10, 20, 30, 40, 50, 60],
+            'title': [
+                "Harry Potter and the Sorcerer's Stone (Harry Potter, #1)",
+                'Harry Potter and the Chamber of Secrets (Harry Potter, #2)',
+                'The Hobbit',
+                'Hamlet',
+                'Hamlet',
+                'Les Misérables',
+            ],
+            'authors': ['J.K. Rowling', 'J.K. Rowling', 'J.R.R. Tolkien', 'William Shakespeare',
+                        'Anonymous', 'Victor Hugo'],
+            'average_rating': [4.44, 4.37, 4.25, 4.0, 3.0, 4.14],
+            'ratings_count': [4602479, 1779331, 2071616, 500000, 100, 620000],
+        })
+        self.index = build_title_index(self.books)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Sorcerer's Stone (Harry Potter, #1)"), 'sorcerers stone harry potter 1')
+        self.assertEqual(normalize('  Les  MISÉRABLES '), 'les miserables')
+
+    def test_prefix_tokens(self):
+        self.assertEqual(list(self.index.search('harry pot')), [10, 20])
+        self.assertEqual(list(self.index.search('potter chamber')), [20])
+        self.assertEqual(list(self.index.search('miserables')), [60])
+        self.assertEqual(list(self.index.search('xyz')), [])
+        self.assertEqual(list(self.index.search('  ')), [])
+
+    def test_title_matches_rank_before_popularity(self):
+        # "The Hobbit" starts with the query; the Harry Potter books only contain it
+        self.assertEqual(list(self.index.search('the', n=3)), [30, 10, 20])
+        self.assertEqual(list(self.index.search('ha', n=2)), [10, 20])
+        self.assertEqual(list(self.index.search('hamlet')), [40, 50])
+
+    def test_duplicate_titles_have_distinct_ids(self):
+        rows = self.index.search_rows('hamlet')
+        self.assertEqual(list(self.books['authors'].iloc[rows]), ['William Shakespeare', 'Anonymous'])
+        self.assertEqual(self.index.row(50), 4)
+        with self.assertRaises(KeyError):
+            self.index.row(99)
+
+    def test_fuzzy(self):
+        self.assertEqual(list(self.index.search('hary poter')), [])
+        self.assertEqual(list(self.index.search('hary poter', fuzzy=True)), [10, 20])
+
+    def test_built_once_per_version(self):
+        self.books.attrs['catalog_version'] = 'titles-v1'
+        self.assertIs(title_index(self.books), title_index(self.books))
+
+
+if __name__ == '__main__':
+    unittest.main()
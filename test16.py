@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from user_store import UserStore, dedupe
+
+
+class TestUserStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'users.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_signup_and_login(self):
+        store = UserStore(self.path)
+        self.assertTrue(store.add_user('alice', 'hash1'))
+        self.assertFalse(store.add_user('alice', 'hash2'))
+        self.assertTrue(store.login('alice', 'hash1'))
+        self.assertFalse(store.login('alice', 'hash2'))
+        self.assertFalse(store.login('bob', 'hash1'))
+        self.assertEqual(store.users(), [('alice', 'hash1')])
+
+    def test_concurrent_signups(self):
+        store = UserStore(self.path)
+        futures = [store.add_user_async('user{}'.format(i % 50), 'hash') for i in range(100)]
+        self.assertEqual(sum(f.result() for f in futures), 50)
+        with ThreadPoolExecutor(8) as pool:
+            logins = list(pool.map(lambda i: store.login('user{}'.format(i), 'hash'), range(50)))
+        self.assertTrue(all(logins))
+
+    def test_setup_refuses_duplicate_usernames(self):
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.execute('CREATE TABLE userstable(username TEXT,password TEXT)')
+            conn.executemany('INSERT INTO userstable VALUES (?,?)',
+                             [('alice', 'first'), ('alice', 'second'), ('bob', 'hash')])
+        conn.close()
+
+        with self.assertRaisesRegex(RuntimeError, 'dedupe'):
+            UserStore(self.path)
+        # nothing is deleted until the migration is run
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM userstable').fetchone(), (3,))
+        conn.close()
+
+        self.assertEqual(dedupe(self.path), 1)
+        store = UserStore(self.path)
+        self.assertTrue(store.login('alice', 'first'))
+        self.assertFalse(store.login('alice', 'second'))
+        with store.connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN SELECT password FROM userstable WHERE username = ?', ('bob',)
+            ).fetchall()
+        self.assertIn('userstable_username', plan[0][-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from publish import publishing, resolve
+
+
+def publish(path, text):
+    with publishing(path) as out:
+        with open(os.path.join(out, 'data.txt'), 'w') as f:
+            f.write(text)
+
+
+def read(path):
+    with open(os.path.join(path, 'data.txt')) as f:
+        return f.read()
+
+
+class TestPublishing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'model')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_switches_to_new_build_and_keeps_the_previous(self):
+        publish(self.path, 'one')
+        first = resolve(self.path)
+        publish(self.path, 'two')
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(read(self.path), 'two')
+        # a reader that resolved the link before the switch can still read
+        self.assertEqual(read(first), 'one')
+        publish(self.path, 'three')
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(len(os.listdir(self.path + '.builds')), 2)
+
+    def test_failed_build_leaves_current_one(self):
+        publish(self.path, 'one')
+        with self.assertRaises(ValueError):
+            with publishing(self.path):
+                raise ValueError
+        self.assertEqual(read(self.path), 'one')
+        self.assertEqual(len(os.listdir(self.path + '.builds')), 1)
+
+    def test_replaces_plain_directory(self):
+        os.makedirs(self.path)
+        publish(self.path, 'one')
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(read(self.path), 'one')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,8 @@ from unittest.mock import patch
 import pandas as pd
 import numpy as np
 import streamlit as st
-from main import simple_recommender, content_recommendation, improved_recommendation
+from main import simple_recommender, content_recommendation, improved_recommendation, content
+from neighbors import build_neighbor_index
 
 class TestRecommendation(unittest.TestCase):
     def setUp(self):
@@ -22,17 +23,34 @@ class TestRecommendation(unittest.TestCase):
         self.assertEqual(len(result), 2)
         self.assertEqual(result.iloc[0]['title'], 'Book1')
 
+    def test_simple_recommender_ranks_once_per_version(self):
+        self.books.attrs['catalog_version'] = 'v1'
+        first = simple_recommender(books=self.books, n=3)
+        self.assertNotIn('score', self.books.columns)
+        with patch('popularity.build_ranking') as mock_build_ranking:
+            result = simple_recommender(books=self.books, n=1)
+        mock_build_ranking.assert_not_called()
+        self.assertEqual(list(result['title']), list(first['title'][:1]))
+
+    @patch('main.content_build_id', return_value='build1')
+    @patch('main._content')
+    def test_content_is_cached_by_version(self, mock_content, mock_build_id):
+        # the books frame is passed as an unhashed `_books` argument
+        self.books.attrs['catalog_version'] = 'content-v1'
+        content(self.books)
+        mock_content.assert_called_once_with('content-v1', 'build1', self.books)
+
     @patch('main.read_book_data')
-    @patch('main.content', return_value=(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), pd.Series([0, 1, 2], index=['Book1', 'Book2', 'Book3'])))
+    @patch('main.content', return_value=build_neighbor_index(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]])))
     def test_content_recommendation(self, mock_read_book_data, mock_content):
-        result = content_recommendation(books=self.books, title='Book1', n=2)
+        result = content_recommendation(books=self.books, book_id=1, n=2)
         self.assertEqual(len(result), 2)
         self.assertEqual(result.iloc[0]['title'], 'Book2')
 
     @patch('main.read_book_data')
-    @patch('main.content', return_value=(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), pd.Series([0, 1, 2], index=['Book1', 'Book2', 'Book3'])))
+    @patch('main.content', return_value=build_neighbor_index(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]])))
     def test_improved_recommendation(self, mock_read_book_data, mock_content):
-        result = improved_recommendation(books=self.books, title='Book1', n=2)
+        result = improved_recommendation(books=self.books, book_id=1, n=2)
         self.assertEqual(len(result), 1)
         self.assertEqual(result.iloc[0]['title'], 'Book2')
 
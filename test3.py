@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import linear_kernel
+from sklearn.preprocessing import normalize
+
+from neighbors import build_neighbor_index, top_n
+
+
+class TestNeighborIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        dense = rng.random((40, 12)) * (rng.random((40, 12)) > 0.6)
+        self.matrix = sp.csr_matrix(normalize(dense))
+
+    def test_matches_dense_kernel(self):
+        cosine = linear_kernel(self.matrix, self.matrix)
+        index = build_neighbor_index(self.matrix, k=5, block_size=7)
+        for row in range(self.matrix.shape[0]):
+            expected = np.delete(cosine[row], row)
+            expected = np.sort(expected)[::-1][:5]
+            np.testing.assert_allclose(index.scores[row], expected, rtol=1e-5)
+            self.assertNotIn(row, index.ids[row])
+
+    def test_compact_dtypes(self):
+        index = build_neighbor_index(self.matrix, k=5)
+        self.assertEqual(index.ids.dtype, np.int32)
+        self.assertEqual(index.scores.dtype, np.float32)
+        self.assertEqual(index.ids.shape, (40, 5))
+
+    def test_pads_small_catalogs(self):
+        index = build_neighbor_index(np.eye(3), k=4)
+        ids, scores = index.neighbors(0)
+        self.assertEqual(list(ids), [1, 2])
+        self.assertEqual(index.ids[0, 2], -1)
+
+
+class TestTopN(unittest.TestCase):
+    def test_excludes_query_by_index(self):
+        # the query row is not the best match, so dropping position 0 would be wrong
+        ids, scores = top_n([0.9, 0.5, 1.0, 0.7], 2, exclude=1)
+        self.assertEqual(list(ids[0]), [2, 0])
+        np.testing.assert_allclose(scores[0], [1.0, 0.9])
+
+    def test_batch_matches_single_rows(self):
+        rng = np.random.default_rng(1)
+        scores = rng.random((6, 50))
+        rows = np.arange(6)
+        ids, _ = top_n(scores, 5, exclude=rows)
+        for row in rows:
+            expected = [i for i in np.argsort(-scores[row], kind='stable') if i != row][:5]
+            self.assertEqual(list(ids[row]), expected)
+
+    def test_ties_prefer_lower_index(self):
+        ids, _ = top_n(np.zeros(5), 3, exclude=0)
+        self.assertEqual(list(ids[0]), [1, 2, 3])
+
+    def test_ties_at_the_cutoff_match_stable_sort(self):
+        rng = np.random.default_rng(0)
+        scores = rng.integers(0, 3, (50, 200)).astype(float)
+        exclude = rng.integers(0, 200, 50)
+        ids, _ = top_n(scores, 60, exclude=exclude)
+        scores[np.arange(50), exclude] = -np.inf
+        np.testing.assert_array_equal(ids, np.argsort(-scores, axis=1, kind='stable')[:, :60])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from content_model import build_id, fit_content, load_content, save_content
+
+
+class TestContentArtifact(unittest.TestCase):
+    def setUp(self):
+        self.books = pd.DataFrame({
+            'book_id': [1, 2, 3, 4],
+            'title': ['Wizard School', 'Crime Scene', 'Wizard War', 'Love Story'],
+            'authors': ['Author1', 'Author2', 'Author1', 'Author3'],
+            'genres': ['fantasy', 'crime, mystery', 'fantasy', 'romance'],
+            'description': ['young wizard magic', 'detective solves murder', 'wizard magic battle', None],
+        })
+        self.books.attrs['catalog_version'] = 'v1'
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'content')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_is_memory_mapped(self):
+        model = fit_content(self.books, k=2)
+        save_content(model, self.path)
+        loaded = load_content(self.path, version='v1')
+
+        self.assertIsInstance(loaded.neighbors.ids, np.memmap)
+        self.assertIsInstance(loaded.matrix.indices.base.base, np.memmap)
+        self.assertIsInstance(loaded.terms.blob, np.memmap)
+        np.testing.assert_array_equal(loaded.neighbors.ids, model.neighbors.ids)
+        np.testing.assert_allclose(loaded.matrix.toarray(), model.matrix.toarray())
+        self.assertEqual(loaded.index['Wizard War'], 2)
+        self.assertEqual(list(loaded.terms), list(model.terms))
+        self.assertEqual(loaded.terms[1], model.terms[1])
+        self.assertEqual(loaded.neighbors.ids[0, 0], 2)
+
+    def test_stale_or_missing_artifact(self):
+        self.assertIsNone(load_content(self.path))
+        save_content(fit_content(self.books, k=2), self.path)
+        self.assertIsNone(load_content(self.path, version='v2'))
+
+    def test_every_save_gets_a_new_build_id(self):
+        self.assertIsNone(build_id(self.path))
+        model = fit_content(self.books, k=2)
+        save_content(model, self.path)
+        first = build_id(self.path)
+        save_content(model, self.path)
+        self.assertNotIn(build_id(self.path), (None, first))
+
+    def test_does_not_mutate_books(self):
+        fit_content(self.books, k=2)
+        self.assertNotIn('content', self.books.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
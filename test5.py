@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from catalog import convert_catalog, read_catalog, read_columnar
+
+
+class TestColumnarCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, 'books.csv')
+        self.path = os.path.join(self.tmp.name, 'catalog')
+        pd.DataFrame({
+            'book_id': [1, 2, 3],
+            'title': ['Book1', 'Book2', 'Book1'],
+            'authors': ['Author1', None, 'Author1'],
+            'genres': ['fantasy', 'crime', None],
+            'description': ['naïve wizard', None, ''],
+            'average_rating': [4.5, 4.0, 3.5],
+            'ratings_count': [10000, 5000, 2000],
+        }).to_csv(self.csv, index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        convert_catalog(self.csv, self.path)
+        books = read_columnar(self.path)
+        expected = pd.read_csv(self.csv)
+        self.assertEqual(list(books.columns), list(expected.columns))
+        for name in ['title', 'authors', 'genres', 'description']:
+            self.assertEqual(
+                list(books[name].astype(object).where(books[name].notna(), None)),
+                list(expected[name].astype(object).where(expected[name].notna(), None)),
+            )
+        np.testing.assert_allclose(books['average_rating'], expected['average_rating'], rtol=1e-6)
+
+    def test_compact_dtypes_and_projection(self):
+        convert_catalog(self.csv, self.path)
+        books = read_columnar(self.path, columns=['book_id', 'title', 'average_rating'])
+        self.assertEqual(list(books.columns), ['book_id', 'title', 'average_rating'])
+        self.assertEqual(books['book_id'].dtype, np.int32)
+        self.assertEqual(books['average_rating'].dtype, np.float32)
+        self.assertEqual(books['title'].dtype, 'category')
+
+    def test_read_catalog_prefers_current_columnar_copy(self):
+        books = read_catalog(self.csv, columnar_path=self.path)
+        self.assertEqual(books['book_id'].dtype, np.int64)
+
+        convert_catalog(self.csv, self.path)
+        books = read_catalog(self.csv, columns=['title'], columnar_path=self.path)
+        self.assertEqual(books['title'].dtype, 'category')
+        self.assertEqual(books.attrs['catalog_version'], read_catalog(self.csv).attrs['catalog_version'])
+
+        with open(self.csv, 'a') as f:
+            f.write('4,Book4,Author4,,,3.0,10\n')
+        self.assertEqual(len(read_catalog(self.csv, columnar_path=self.path)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from collab import load_collab, save_collab, train
+from ratings import ingest_ratings, save_ratings
+
+
+class TestCollabModel(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        rows = []
+        for user_id in range(1, 31):
+            for book_id in rng.choice(np.arange(1, 13), 6, replace=False):
+                rows.append((user_id, book_id, rng.integers(1, 6)))
+        # book 99 is not in the catalog
+        rows.append((1, 99, 5))
+        self.ratings = pd.DataFrame(rows, columns=['user_id', 'book_id', 'rating'])
+        self.tmp = tempfile.TemporaryDirectory()
+        csv = os.path.join(self.tmp.name, 'ratings.csv')
+        self.ratings.to_csv(csv, index=False)
+        self.matrix = ingest_ratings(csv, np.arange(1, 13), chunksize=50, version='v1')
+        self.model = train(self.matrix, factors=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_factor_arrays(self):
+        self.assertEqual(self.model.user_factors.dtype, np.float32)
+        self.assertEqual(self.model.item_factors.shape, (12, 4))
+        self.assertEqual(self.matrix.shape, (30, 12))
+
+    def test_recommend_skips_read_books(self):
+        read = set(self.model.book_read(1))
+        expected = set(self.ratings.book_id[(self.ratings.user_id == 1) & (self.ratings.book_id < 99)] - 1)
+        self.assertEqual(read, expected)
+
+        rows, scores = self.model.recommend(1, n=10)
+        self.assertEqual(len(rows), 6)
+        self.assertFalse(read & set(rows))
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.model.user_row(1000))
+        with self.assertRaises(KeyError):
+            self.model.recommend(1000)
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmp.name, 'collab')
+        ratings_path = os.path.join(self.tmp.name, 'ratings')
+        save_collab(self.model, path)
+        self.assertIsNone(load_collab(path, ratings_path=ratings_path))
+        save_ratings(self.matrix, ratings_path)
+        self.assertIsNone(load_collab(path, version='v2', ratings_path=ratings_path))
+        loaded = load_collab(path, version='v1', ratings_path=ratings_path)
+        np.testing.assert_array_equal(loaded.recommend(3, 4)[0], self.model.recommend(3, 4)[0])
+
+    def test_reingest_invalidates_model(self):
+        path = os.path.join(self.tmp.name, 'collab')
+        ratings_path = os.path.join(self.tmp.name, 'ratings')
+        save_ratings(self.matrix, ratings_path)
+        save_collab(self.model, path)
+        # new users shift the rows of the trained ones
+        csv = os.path.join(self.tmp.name, 'ratings.csv')
+        more = pd.DataFrame({'user_id': [0, 100], 'book_id': [1, 2], 'rating': [5, 4]})
+        pd.concat([self.ratings, more]).to_csv(csv, index=False)
+        save_ratings(ingest_ratings(csv, np.arange(1, 13), version='v1'), ratings_path)
+        self.assertIsNone(load_collab(path, version='v1', ratings_path=ratings_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
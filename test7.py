@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from ratings import ingest_ratings, load_ratings, save_ratings
+
+
+class TestRatingsMatrix(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, 'ratings.csv')
+        # user ids are sparse and unsorted; book 7 is not in the catalog
+        pd.DataFrame({
+            'user_id': [42, 3, 42, 10, 3, 42, 10, 3],
+            'book_id': [2, 1, 1, 3, 3, 7, 2, 4],
+            'rating': [5, 4, 3, 2, 1, 5, 4, 3],
+        }).to_csv(self.csv, index=False)
+        self.book_ids = [1, 2, 3, 4]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunk_size_does_not_change_result(self):
+        whole = ingest_ratings(self.csv, self.book_ids, chunksize=100)
+        chunked = ingest_ratings(self.csv, self.book_ids, chunksize=3)
+        np.testing.assert_array_equal(whole.csr.toarray(), chunked.csr.toarray())
+        self.assertEqual(list(chunked.user_ids), [3, 10, 42])
+        np.testing.assert_array_equal(chunked.csr.toarray(), [[4, 0, 1, 3], [0, 4, 2, 0], [3, 5, 0, 0]])
+
+    def test_compact_dtypes(self):
+        ratings = ingest_ratings(self.csv, self.book_ids, chunksize=3)
+        for matrix in (ratings.csr, ratings.csc):
+            self.assertEqual(matrix.indices.dtype, np.int32)
+            self.assertEqual(matrix.data.dtype, np.uint8)
+
+    def test_lookups(self):
+        ratings = ingest_ratings(self.csv, self.book_ids, chunksize=3)
+        self.assertEqual(list(ratings.books_read(42)), [0, 1])
+        self.assertEqual(len(ratings.books_read(5)), 0)
+        self.assertEqual(list(ratings.user_ids[ratings.readers(2)]), [3, 10])
+
+    def test_round_trip(self):
+        ratings = ingest_ratings(self.csv, self.book_ids, chunksize=3, version='v1')
+        path = os.path.join(self.tmp.name, 'ratings')
+        save_ratings(ratings, path)
+        self.assertIsNone(load_ratings(path, version='v2'))
+        loaded = load_ratings(path, version='v1')
+        self.assertIsInstance(loaded.csr.indices.base.base, np.memmap)
+        np.testing.assert_array_equal(loaded.csc.toarray(), ratings.csc.toarray())
+
+
+if __name__ == '__main__':
+    unittest.main()
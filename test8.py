@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from item_item import fit_item_item, load_item_item, save_item_item
+from ratings import ingest_ratings
+
+
+class TestItemItem(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        rows = [(u, b, rng.integers(1, 6)) for u in range(1, 41) for b in rng.choice(np.arange(1, 21), 5, replace=False)]
+        self.tmp = tempfile.TemporaryDirectory()
+        csv = os.path.join(self.tmp.name, 'ratings.csv')
+        pd.DataFrame(rows, columns=['user_id', 'book_id', 'rating']).to_csv(csv, index=False)
+        # book 21 has no ratings at all
+        self.ratings = ingest_ratings(csv, np.arange(1, 22), version='v1')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_dense_cosine(self):
+        dense = cosine_similarity(self.ratings.csc.T.toarray().astype(float))
+        neighbors = fit_item_item(self.ratings, k=4)
+        for row in range(20):
+            expected = np.sort(np.delete(dense[row], row))[::-1][:4]
+            ids, scores = neighbors.neighbors(row)
+            np.testing.assert_allclose(scores, expected[expected > 0], rtol=1e-5)
+            np.testing.assert_allclose(dense[row, ids], scores, rtol=1e-5)
+
+    def test_workers_give_same_table(self):
+        serial = fit_item_item(self.ratings, k=4)
+        with patch('neighbors.rows_per_block', return_value=5):
+            parallel = fit_item_item(self.ratings, k=4, workers=2)
+        np.testing.assert_array_equal(serial.ids, parallel.ids)
+
+    def test_unrated_book_has_no_neighbors(self):
+        neighbors = fit_item_item(self.ratings, k=4)
+        self.assertEqual(len(neighbors.neighbors(20)[0]), 0)
+
+    def test_round_trip(self):
+        neighbors = fit_item_item(self.ratings, k=4)
+        path = os.path.join(self.tmp.name, 'item-item')
+        save_item_item(neighbors, 'v1', path)
+        self.assertIsNone(load_item_item(path, version='v2'))
+        np.testing.assert_array_equal(load_item_item(path, version='v1').ids, neighbors.ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import pandas as pd
+
+from result_cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.books = pd.DataFrame({'title': ['Book1', 'Book2', 'Book3', 'Book4']})
+        self.books.attrs['catalog_version'] = 'v1'
+        self.calls = []
+
+    def make_recommender(self, cache):
+        @cache.cached('test')
+        def recommend(books, title, n=5):
+            self.calls.append((title, n))
+            return books.head(n)
+        return recommend
+
+    def test_larger_n_serves_smaller_n(self):
+        cache = ResultCache()
+        recommend = self.make_recommender(cache)
+        recommend(self.books, 'Book1', n=3)
+        result = recommend(books=self.books, title='Book1', n=2)
+        self.assertEqual(list(result['title']), ['Book1', 'Book2'])
+        recommend(self.books, 'Book1', 4)
+        self.assertEqual(self.calls, [('Book1', 3), ('Book1', 4)])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 0, 'size': 1})
+
+    def test_new_catalog_version_misses(self):
+        cache = ResultCache()
+        recommend = self.make_recommender(cache)
+        recommend(self.books, 'Book1', 2)
+        self.books.attrs['catalog_version'] = 'v2'
+        recommend(self.books, 'Book1', 2)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_new_model_build_misses(self):
+        cache = ResultCache()
+        build = ['build1']
+
+        @cache.cached('test', build=lambda: build[0])
+        def recommend(books, title, n=5):
+            self.calls.append((title, n))
+            return books.head(n)
+
+        recommend(self.books, 'Book1', 2)
+        recommend(self.books, 'Book1', 2)
+        build[0] = 'build2'
+        recommend(self.books, 'Book1', 2)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_unversioned_books_bypass_cache(self):
+        cache = ResultCache()
+        recommend = self.make_recommender(cache)
+        books = pd.DataFrame({'title': ['Book1']})
+        recommend(books, 'Book1')
+        recommend(books, 'Book1')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        recommend = self.make_recommender(cache)
+        recommend(self.books, 'Book1')
+        recommend(self.books, 'Book2')
+        recommend(self.books, 'Book1')
+        recommend(self.books, 'Book3')
+        self.assertEqual(cache.evictions, 1)
+        recommend(self.books, 'Book1')
+        recommend(self.books, 'Book2')
+        self.assertEqual([c[0] for c in self.calls], ['Book1', 'Book2', 'Book3', 'Book2'])
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = ResultCache(ttl=10, clock=clock)
+        recommend = self.make_recommender(cache)
+        recommend(self.books, 'Book1')
+        clock.now = 5
+        recommend(self.books, 'Book1')
+        clock.now = 11
+        recommend(self.books, 'Book1')
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
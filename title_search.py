@@ -0,0 +1,201 @@
+"""Title search for picking a book.
+
+Titles are normalized (case, accents and punctuation folded) and split
+into tokens. The index keeps the sorted token vocabulary and, per token,
+the rows of the titles containing it, so every query token is matched as
+a prefix with two binary searches:
+
+    index = title_index(books)
+    index.search("harry pot")  # book ids, best match first
+    index.search("hary poter", fuzzy=True)
+
+Matches are ranked by whether the whole title equals or starts with the
+query, then by popularity (ratings_count).
+"""
+import difflib
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from neighbors import top_n
+
+SEARCH_RESULTS = 20
+FUZZY_CUTOFF = 0.75
+
+_APOSTROPHES = re.compile(r"['’]")
+_NON_WORD = re.compile(r"[\W_]+")
+# sorts after every string that starts with a given prefix
+_PREFIX_END = "\U0010ffff"
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Fold case, accents and punctuation: "Sorcerer's Stone" -> "sorcerers stone" """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", _APOSTROPHES.sub("", text).casefold()).split())
+
+
+class TitleIndex:
+    """Token index over the catalog's titles.
+
+    The rows of the titles containing token `vocab[t]` are
+    `postings[offsets[t]:offsets[t + 1]]`; `first_token` and `n_tokens`
+    describe each row's title. Also maps book ids to rows.
+    """
+
+    def __init__(self, vocab, offsets, postings, titles, first_token, n_tokens, popularity,
+                 book_ids):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.titles = titles
+        self.first_token = first_token
+        self.n_tokens = n_tokens
+        self.popularity = popularity
+        self.book_ids = book_ids
+        self._id_order = np.argsort(book_ids, kind="stable")
+        self._sorted_ids = book_ids[self._id_order]
+
+    def row(self, book_id):
+        """Catalog row of `book_id`; raises KeyError if it is not in the catalog"""
+        pos = np.searchsorted(self._sorted_ids, book_id)
+        if pos == len(self._sorted_ids) or self._sorted_ids[pos] != book_id:
+            raise KeyError(book_id)
+        return int(self._id_order[pos])
+
+    def _token_range(self, prefix):
+        lo, hi = np.searchsorted(self.vocab, [prefix, prefix + _PREFIX_END])
+        return lo, hi
+
+    def _close_tokens(self, token):
+        """Vocabulary ids of tokens within edit distance of `token`"""
+        # misspellings rarely get the first letter wrong; only look there
+        lo, hi = self._token_range(token[0])
+        close = difflib.get_close_matches(token, self.vocab[lo:hi].tolist(), n=5, cutoff=FUZZY_CUTOFF)
+        return [lo + int(np.searchsorted(self.vocab[lo:hi], t)) for t in close]
+
+    def _rows(self, token, fuzzy):
+        lo, hi = self._token_range(token)
+        parts = [self.postings[self.offsets[lo] : self.offsets[hi]]]
+        if fuzzy:
+            parts += [self.postings[self.offsets[t] : self.offsets[t + 1]] for t in self._close_tokens(token)]
+        return np.unique(np.concatenate(parts))
+
+    def search_rows(self, query, n=SEARCH_RESULTS, fuzzy=False):
+        """Catalog rows of the best n matches for `query`.
+
+        Every query token must be a prefix of a title token. With fuzzy,
+        tokens also match close misspellings, but only when the exact pass
+        finds fewer than n titles.
+        """
+        query = normalize(query)
+        tokens = query.split()
+        if not tokens:
+            return np.empty(0, dtype=np.int64)
+        rows = self._match(tokens, False)
+        if fuzzy and len(rows) < n:
+            rows = np.union1d(rows, self._match(tokens, True))
+        if len(rows) == 0:
+            return rows
+
+        # whole-title matches first, then popularity
+        starts, exact = self._title_matches(rows, query, tokens)
+        popularity = self.popularity[rows]
+        score = (popularity - popularity.min()) / (np.ptp(popularity) + 1) + starts + 2 * exact
+        best, _ = top_n(score, n)
+        best = best[0][best[0] >= 0]
+        return rows[best]
+
+    def _title_matches(self, rows, query, tokens):
+        """Which `rows` have a title starting with, or equal to, `query`"""
+        lo, hi = self._token_range(tokens[0])
+        first = self.first_token[rows]
+        candidates = (first >= lo) & (first < hi)
+        if len(tokens) == 1:
+            # a one-token query is a prefix of the title iff of its first token
+            exact = candidates & (self.n_tokens[rows] == 1) & (self.vocab[np.maximum(first, 0)] == query)
+            return candidates, exact
+        starts = np.zeros(len(rows), dtype=bool)
+        exact = np.zeros(len(rows), dtype=bool)
+        for i in np.flatnonzero(candidates):
+            title = self.titles[rows[i]]
+            starts[i] = title.startswith(query)
+            exact[i] = title == query
+        return starts, exact
+
+    def _match(self, tokens, fuzzy):
+        rows = None
+        for token in tokens:
+            found = self._rows(token, fuzzy)
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+            if len(rows) == 0:
+                break
+        return rows
+
+    def search(self, query, n=SEARCH_RESULTS, fuzzy=False):
+        """Book ids of the best n matches for `query`"""
+        return self.book_ids[self.search_rows(query, n, fuzzy)]
+
+
+def build_title_index(books):
+    # duplicate titles are normalized once
+    codes, uniques = pd.factorize(books["title"])
+    normalized = np.array([normalize(str(t)) for t in uniques] + [""], dtype=object)
+    titles = normalized[codes]
+
+    tokens = []
+    rows = []
+    for row, title in enumerate(titles):
+        for token in set(title.split()):
+            tokens.append(token)
+            rows.append(row)
+    vocab, inverse = np.unique(np.array(tokens, dtype=str), return_inverse=True)
+    postings = np.array(rows, dtype=np.int32)[np.argsort(inverse, kind="stable")]
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(vocab)), out=offsets[1:])
+
+    split = [title.split() for title in normalized]
+    first = np.array([words[0] if words else "" for words in split], dtype=str)
+    first_token = np.where(first == "", -1, np.searchsorted(vocab, first))[codes]
+    n_tokens = np.array([len(words) for words in split], dtype=np.int32)[codes]
+
+    return TitleIndex(
+        vocab=vocab,
+        offsets=offsets,
+        postings=postings,
+        titles=titles,
+        first_token=first_token,
+        n_tokens=n_tokens,
+        popularity=np.nan_to_num(books["ratings_count"].to_numpy(dtype=np.float64)),
+        book_ids=books["book_id"].to_numpy(),
+    )
+
+
+def title_index(books):
+    """Return the title index of `books`, built once per catalog version.
+
+    Frames without a `catalog_version` attr are indexed on every call.
+    """
+    version = books.attrs.get("catalog_version")
+    if version is None:
+        return build_title_index(books)
+    index = _indexes.get(version)
+    if index is None:
+        with _lock:
+            index = _indexes.get(version)
+            if index is None:
+                index = build_title_index(books)
+                _indexes.clear()
+                _indexes[version] = index
+    return index
+
+
+def book_row(books, book_id):
+    """Catalog row of `book_id`; raises KeyError for an unknown book"""
+    return title_index(books).row(book_id)
@@ -0,0 +1,220 @@
+"""SQLite store of app users.
+
+The schema is set up once per process: `userstable` gets a unique index
+on username, so a login is one index lookup, and the database is put in
+WAL mode so logins read while a signup writes. Reads borrow a connection
+from a small pool; signups are queued and committed in batches by a
+single writer thread, which waits for each to land before returning.
+
+    users = user_store()
+    users.add_user("alice", make_hashes("secret"))
+    users.login("alice", make_hashes("secret"))  # True
+
+Tables from before usernames were unique may hold the same username more
+than once; the store refuses to open them until
+
+    $ python user_store.py dedupe --apply
+
+has kept the first account of each.
+"""
+import argparse
+import hmac
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from instrumentation import inc, span
+
+DB_PATH = "data.db"
+POOL_SIZE = 8
+# most signups a single write transaction commits
+BATCH_SIZE = 256
+# seconds a connection waits for a lock before raising "database is locked"
+BUSY_TIMEOUT = 5.0
+
+_stores = {}
+_lock = threading.Lock()
+
+
+class UserStore:
+    """Usernames and password hashes in `userstable`"""
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._pending = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._setup()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # durable across application crashes; only an OS crash can lose the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS userstable(username TEXT,password TEXT)")
+                try:
+                    conn.execute(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS userstable_username ON userstable(username)"
+                    )
+                except sqlite3.IntegrityError:
+                    # signups used to allow taken usernames; which account keeps
+                    # the name is for an operator to decide, not for startup
+                    raise RuntimeError(
+                        "{} has {} usernames with several accounts; review them with "
+                        "`python user_store.py dedupe --db {}` and add --apply to keep "
+                        "the first account of each".format(
+                            self.path, len(duplicates(conn)), self.path
+                        )
+                    ) from None
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; opens a new one if the pool is empty"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def login(self, username, password_hash):
+        """True if `username` exists and has `password_hash`"""
+        with span("user_store.login"), self.connection() as conn:
+            row = conn.execute(
+                "SELECT password FROM userstable WHERE username = ?", (username,)
+            ).fetchone()
+        return row is not None and hmac.compare_digest(row[0], password_hash)
+
+    def users(self):
+        with self.connection() as conn:
+            return conn.execute("SELECT username, password FROM userstable").fetchall()
+
+    def add_user(self, username, password_hash):
+        """Create an account; returns False if `username` is taken.
+
+        Blocks until the batch holding the signup is committed.
+        """
+        with span("user_store.add_user"):
+            return self.add_user_async(username, password_hash).result()
+
+    def add_user_async(self, username, password_hash):
+        """Queue a signup; the returned Future resolves to `add_user`'s result"""
+        future = Future()
+        self._pending.put((username, password_hash, future))
+        self._start_writer()
+        return future
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write, name="user-store-writer",
+                                                daemon=True)
+                self._writer.start()
+
+    def _write(self):
+        conn = self._connect()
+        while True:
+            # everything queued while the last batch committed goes in the next one
+            batch = [self._pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    created = [
+                        conn.execute(
+                            "INSERT OR IGNORE INTO userstable(username,password) VALUES (?,?)",
+                            (username, password_hash),
+                        ).rowcount == 1
+                        for username, password_hash, _ in batch
+                    ]
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            inc("user_store_batches_total")
+            for (_, _, future), ok in zip(batch, created):
+                future.set_result(ok)
+
+
+def duplicates(conn):
+    """Usernames held by more than one row, with their row count"""
+    return conn.execute(
+        "SELECT username, COUNT(*) FROM userstable GROUP BY username HAVING COUNT(*) > 1"
+    ).fetchall()
+
+
+def dedupe(path=DB_PATH):
+    """One-off migration for tables from before usernames were unique.
+
+    Keeps the first account created under each username and deletes the
+    others. Returns the number of rows deleted.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        with conn:
+            return conn.execute(
+                "DELETE FROM userstable WHERE rowid NOT IN "
+                "(SELECT MIN(rowid) FROM userstable GROUP BY username)"
+            ).rowcount
+    finally:
+        conn.close()
+
+
+def user_store(path=DB_PATH):
+    """Return the process's store for `path`, setting its schema up on first use"""
+    store = _stores.get(path)
+    if store is None:
+        with _lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = UserStore(path)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    dedupe_cmd = sub.add_parser("dedupe", help="list (or with --apply, delete) duplicate usernames")
+    dedupe_cmd.add_argument("--db", default=DB_PATH)
+    dedupe_cmd.add_argument("--apply", action="store_true",
+                            help="keep the first account of each username, delete the rest")
+    args = parser.parse_args()
+
+    if args.command == "dedupe":
+        conn = sqlite3.connect(args.db)
+        try:
+            found = duplicates(conn)
+        finally:
+            conn.close()
+        for username, count in found:
+            print("{} ({} accounts)".format(username, count))
+        if args.apply:
+            print("deleted {} rows from {}".format(dedupe(args.db), args.db))
+        elif found:
+            print("run again with --apply to keep the first account of each")
+
+
+if __name__ == "__main__":
+    main()